@@ -0,0 +1,209 @@
+import random
+import threading
+import time
+
+from connectivity import classify_error
+
+
+# Gemini calls streaming at the same time; more wait for a free slot.
+MAX_CONCURRENT_CALLS = 3
+# Attempts of a call refused for quota, and the backoff between them in seconds.
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 30.0
+
+
+class RequestCancelled(Exception):
+    """Raised when reading a Subscription that was cancelled."""
+
+
+def _close(stream):
+    close = getattr(stream, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception as e:
+            print(e)
+
+
+class _Call:
+    # One Gemini call and the pieces of text it produced so far
+    def __init__(self, key):
+        self.key = key
+        self.pieces = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.holds_slot = False
+        self.stream = None
+        self.cancelled = threading.Event()
+        self.condition = threading.Condition()
+
+
+class Subscription:
+    """Iterates over the pieces of text of a call, from the first one.
+
+    cancel() may be called from any thread; the thread iterating stops at once
+    with RequestCancelled, whatever the network is doing.
+    """
+
+    def __init__(self, manager, call):
+        self._manager = manager
+        self._call = call
+        self._cancelled = False
+        self._detached = False
+
+    def cancel(self):
+        with self._call.condition:
+            self._cancelled = True
+            self._call.condition.notify_all()
+        self._detach()
+
+    def _detach(self):
+        with self._call.condition:
+            if self._detached:
+                return
+            self._detached = True
+        self._manager._release(self._call)
+
+    def __iter__(self):
+        call = self._call
+        position = 0
+        try:
+            while True:
+                with call.condition:
+                    while position == len(call.pieces) and not call.done and not self._cancelled:
+                        call.condition.wait()
+                    if self._cancelled:
+                        raise RequestCancelled()
+                    if position < len(call.pieces):
+                        piece = call.pieces[position]
+                        position += 1
+                    elif call.error is not None:
+                        raise call.error
+                    else:
+                        return
+                yield piece
+        finally:
+            self._detach()
+
+
+class AiRequestManager:
+    """Runs streamed Gemini calls on daemon threads, shared, capped and retried.
+
+    stream(key, start) returns a Subscription to the call for key, starting it
+    with start() unless an identical call is already running, in which case
+    the new subscriber first gets the pieces already received. start() returns
+    an iterable of text pieces; if it has a close() method, that is called from
+    another thread to end a call whose subscribers all cancelled. A call keeps
+    its slot until its thread is done with the network.
+    At most max_concurrent calls run together, started in the order they
+    were asked for. A call refused for quota is retried with exponential
+    backoff, which also holds back the calls waiting for a slot, as long as
+    none of its answer was received yet.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_CALLS, max_attempts=MAX_ATTEMPTS):
+        self.max_concurrent = max_concurrent
+        self.max_attempts = max_attempts
+        self._calls = {}
+        self._active = 0
+        self._waiting = []
+        self._not_before = 0.0
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+
+    def stream(self, key, start):
+        """Return a Subscription to the call for key."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call(key)
+                threading.Thread(target=self._run, args=(call, start), daemon=True).start()
+            call.subscribers += 1
+        return Subscription(self, call)
+
+    def active(self):
+        with self._lock:
+            return self._active
+
+    def _release(self, call):
+        with self._lock:
+            call.subscribers -= 1
+            if call.subscribers or call.done:
+                return
+            call.cancelled.set()
+            if self._calls.get(call.key) is call:
+                del self._calls[call.key]
+            stream = call.stream
+            # A call still waiting for a slot leaves the line
+            self._slot_free.notify_all()
+        with call.condition:
+            call.condition.notify_all()
+        _close(stream)
+
+    def _free_slot(self, call):
+        # Called with the lock held, from the thread of the call once it is done with the stream
+        if call.holds_slot:
+            call.holds_slot = False
+            self._active -= 1
+        self._slot_free.notify_all()
+
+    def _acquire(self, call):
+        with self._lock:
+            self._waiting.append(call)
+            try:
+                while True:
+                    if call.cancelled.is_set():
+                        return False
+                    delay = self._not_before - time.monotonic()
+                    if self._waiting[0] is call and self._active < self.max_concurrent and delay <= 0:
+                        self._active += 1
+                        call.holds_slot = True
+                        return True
+                    self._slot_free.wait(delay if delay > 0 else None)
+            finally:
+                self._waiting.remove(call)
+                # The next call in line may now take a slot
+                self._slot_free.notify_all()
+
+    def _run(self, call, start):
+        attempt = 0
+        error = None
+        while self._acquire(call):
+            try:
+                stream = start()
+                with self._lock:
+                    call.stream = stream
+                if call.cancelled.is_set():
+                    # Cancelled while the call was being made
+                    _close(stream)
+                for piece in stream:
+                    if call.cancelled.is_set():
+                        break
+                    with call.condition:
+                        call.pieces.append(piece)
+                        call.condition.notify_all()
+                error = None
+                break
+            except Exception as e:
+                error = e
+                if call.cancelled.is_set():
+                    break
+                attempt += 1
+                if classify_error(e)[0] != "quota" or call.pieces or attempt >= self.max_attempts:
+                    break
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.75, 1.25)
+                with self._lock:
+                    self._not_before = max(self._not_before, time.monotonic() + delay)
+            finally:
+                with self._lock:
+                    call.stream = None
+                    self._free_slot(call)
+        with self._lock:
+            if self._calls.get(call.key) is call:
+                del self._calls[call.key]
+        with call.condition:
+            call.done = True
+            call.error = error
+            call.condition.notify_all()
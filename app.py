@@ -1,13 +1,15 @@
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QApplication,QWidget
-from  main import MainWindow
-from library import Library
+import multiprocessing
 
 def load_stylesheet(file_name):
     with open(file_name,'r') as file:
         return file.read()
 
 def main():
+    # Imported here rather than at the top: the spawned render and indexing workers
+    # import this module too, and must not load the GUI and the Gemini client
+    from PyQt5.QtWidgets import QApplication
+    from main import MainWindow
+
     app = QApplication([])
     main_context = MainWindow()
     
@@ -17,4 +19,7 @@ def main():
     app.exec_()
 
 if __name__ == "__main__":
+    # In a frozen build the render and indexing workers start this executable;
+    # this turns them into workers instead of new copies of the GUI
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,48 @@
+import os
+import sqlite3
+import threading
+from multiprocessing import cpu_count
+
+
+# Per-user directory holding the library catalog, search index and caches.
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".student_assistant")
+# Upper bound on the processes of a worker pool, for rendering or text extraction.
+WORKER_PROCESSES = max(1, min(cpu_count(), 8))
+
+
+def data_path(file_name):
+    """Return the path of file_name inside DATA_DIR, creating the directory if needed."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, file_name)
+
+
+def normalize_path(path):
+    """Return path in the form used to compare and look up files: absolute, and case-folded where the OS is."""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def is_inside(path, folder):
+    """Return whether path is folder or below it; paths on different drives never are."""
+    path, folder = normalize_path(path), normalize_path(folder)
+    return path == folder or path.startswith(os.path.join(folder, ""))
+
+
+class ThreadConnections:
+    """sqlite3 connections to the database at path, one per thread, in WAL mode.
+
+    sqlite3 connections may only be used on the thread that created them; WAL
+    lets the GUI thread read while a background thread writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def get(self):
+        """Return the connection of the calling thread, opening it on first use."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
@@ -0,0 +1,222 @@
+"""Rendering benchmarks for the library viewer.
+
+    python benchmarks/bench_render.py [--kinds text vector scanned] [--pages 10 200 2000]
+                                      [--output results.json] [--compare baseline.json]
+
+Each (kind, pages) case runs in a fresh process, so its peak RSS is its own.
+A case measures, on a synthetic PDF:
+
+  ttfp_ms               startLoadingPDF until the first page is painted with content
+  throughput_pages_s    every page rendered once at 100% through a RenderScheduler
+  bytes_copied_per_image  sample bytes copied from fitz to the delivered QImage, per image
+  zoom_preview_ms       time spent inside one zoom step (the stretched preview)
+  zoom_sharp_ms         zoom step until every visible page is sharp again,
+                        including the ZOOM_SETTLE_MS pause
+  peak_rss_mb           peak RSS of the GUI process
+  workers_peak_rss_mb   largest peak RSS among the render workers
+
+--compare prints the change of every metric against an earlier results file
+and exits with status 1 when one regressed by more than --threshold percent.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic
+
+
+DEFAULT_PAGES = (10, 200, 2000)
+ZOOM_STEPS = 3
+# Seconds a single wait may take before the case is reported as failed.
+WAIT_TIMEOUT = 600
+VIEW_SIZE = (1000, 800)
+
+# Metrics where a larger value is better; a larger value is worse for the others.
+HIGHER_IS_BETTER = {"throughput_pages_s"}
+METRICS = ("ttfp_ms", "throughput_pages_s", "bytes_copied_per_image", "zoom_preview_ms",
+           "zoom_sharp_ms", "peak_rss_mb", "workers_peak_rss_mb")
+
+
+def peak_rss_mb(who):
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss * scale / 2**20
+
+
+def wait_until(app, condition, timeout=WAIT_TIMEOUT):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("benchmark step timed out")
+        app.processEvents()
+        time.sleep(0.0005)
+    return time.perf_counter()
+
+
+def visible_pages_sharp(view):
+    scale = view._renderScale()
+    return all(view._pages[page].hasImage(tile, scale)
+               for page in view._visibleRange(0)
+               for _, tile in view._wantedJobs(page, scale))
+
+
+def run_case(kind, pages):
+    """Measure one case in this process and return its metrics."""
+    from PyQt5.QtWidgets import QApplication
+    import library
+
+    path = synthetic.ensure_pdf(kind, pages)
+    app = QApplication.instance() or QApplication([])
+    library.page_cache.clear()
+
+    view = library.PDFView()
+    view.resize(*VIEW_SIZE)
+    view.show()
+    # Time to first page is measured with the workers already started, as in the app
+    pool = library.render_pool()
+    pool.map(abs, range(library.RENDER_WORKERS * 4))
+
+    start = time.perf_counter()
+    view.startLoadingPDF(path)
+    first_page = wait_until(app, lambda: any(page.hasContent() for page in view._pages))
+    wait_until(app, lambda: visible_pages_sharp(view))
+
+    zoom_preview = []
+    zoom_sharp = []
+    for _ in range(ZOOM_STEPS):
+        zoom_start = time.perf_counter()
+        view.zoomInClicked()
+        zoom_preview.append(time.perf_counter() - zoom_start)
+        zoom_sharp.append(wait_until(app, lambda: visible_pages_sharp(view)) - zoom_start)
+
+    # Throughput through a scheduler of its own, with nothing served from the cache
+    library.page_cache.clear()
+    scheduler = library.RenderScheduler()
+    delivered = []
+    scheduler.page_loaded.connect(lambda generation, job, image: delivered.append(job))
+    scheduler.start()
+    throughput_start = time.perf_counter()
+    scheduler.setDocument(path, 1.0)
+    scheduler.submit([(page, None) for page in range(pages)])
+    throughput_end = wait_until(app, lambda: len(delivered) >= pages)
+    copy_stats = scheduler.copyStats()
+    scheduler.stop()
+    view._scheduler.stop()
+
+    # Workers count towards RUSAGE_CHILDREN only once they have been joined
+    pool.close()
+    pool.join()
+    library._render_pool = None
+
+    return {
+        "kind": kind,
+        "pages": pages,
+        "ttfp_ms": (first_page - start) * 1000,
+        "throughput_pages_s": pages / (throughput_end - throughput_start),
+        "bytes_copied_per_image": copy_stats["bytes_copied_per_image"],
+        "zoom_preview_ms": sum(zoom_preview) / len(zoom_preview) * 1000,
+        "zoom_sharp_ms": sum(zoom_sharp) / len(zoom_sharp) * 1000,
+        "peak_rss_mb": peak_rss_mb(0),  # resource.RUSAGE_SELF
+        "workers_peak_rss_mb": peak_rss_mb(-1),  # resource.RUSAGE_CHILDREN
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(kinds, page_counts):
+    results = []
+    for kind in kinds:
+        for pages in page_counts:
+            print(f"{kind} {pages} pages ...", file=sys.stderr, flush=True)
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", kind, str(pages)],
+                                       capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(completed.stderr, file=sys.stderr)
+                results.append({"kind": kind, "pages": pages, "error": completed.stderr.strip()[-500:]})
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            print("  " + ", ".join(f"{name} {result[name]:.1f}" for name in METRICS
+                                   if result.get(name) is not None), file=sys.stderr)
+            results.append(result)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Print the change of each metric against baseline; return the number of regressions."""
+    previous = {(r["kind"], r["pages"]): r for r in baseline["results"] if "error" not in r}
+    regressions = 0
+    print(f"{'case':<16}{'metric':<26}{'baseline':>12}{'current':>12}{'change':>10}")
+    for result in current["results"]:
+        old = previous.get((result["kind"], result["pages"]))
+        if old is None or "error" in result:
+            continue
+        for name in METRICS:
+            if result.get(name) is None or not old.get(name):
+                continue
+            change = (result[name] - old[name]) / old[name] * 100
+            worse = -change if name in HIGHER_IS_BETTER else change
+            flag = "  REGRESSION" if worse > threshold else ""
+            regressions += bool(flag)
+            print(f"{result['kind'] + ' ' + str(result['pages']):<16}{name:<26}"
+                  f"{old[name]:>12.1f}{result[name]:>12.1f}{change:>+9.1f}%{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PDF rendering on synthetic documents.")
+    parser.add_argument("--kinds", nargs="+", choices=synthetic.KINDS, default=list(synthetic.KINDS))
+    parser.add_argument("--pages", nargs="+", type=int, default=list(DEFAULT_PAGES))
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent change counted as a regression (default 10)")
+    parser.add_argument("--case", nargs=2, metavar=("KIND", "PAGES"), help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+
+    if options.case:
+        # Child process of run_all: one case, its metrics as the last line of stdout
+        print(json.dumps(run_case(options.case[0], int(options.case[1]))))
+        return 0
+
+    results = run_all(options.kinds, options.pages)
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if options.compare:
+        with open(options.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, options.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
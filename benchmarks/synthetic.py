@@ -0,0 +1,91 @@
+"""Deterministic synthetic PDFs for the rendering benchmarks.
+
+Three kinds of pages stress different parts of MuPDF: "text" pages are dense
+paragraphs, "vector" pages are hundreds of stroked and filled paths, and
+"scanned" pages are one full-page raster image each, like a scanned book.
+"""
+import os
+import random
+
+import fitz  # PyMuPDF
+
+
+KINDS = ("text", "vector", "scanned")
+# Bump when the generated content changes so cached files are rebuilt.
+GENERATOR_VERSION = 1
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+# A4 in points, and the resolution of the "scanned" images.
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+SCAN_DPI = 150
+# Distinct scan images cycled through the document.
+SCAN_IMAGES = 4
+
+WORDS = ("graph vertex edge shortest path heap queue tree balance rotation hash table "
+         "collision probe array pointer memory cache line latency bandwidth thread "
+         "process kernel schedule lock atomic matrix vector eigen value integral proof").split()
+
+
+def _text_page(doc, rng):
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(60)]
+    page.insert_textbox(fitz.Rect(40, 40, PAGE_WIDTH - 40, PAGE_HEIGHT - 40), "\n".join(lines), fontsize=9)
+
+
+def _vector_page(doc, rng):
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    point = lambda: fitz.Point(rng.uniform(0, PAGE_WIDTH), rng.uniform(0, PAGE_HEIGHT))
+    for _ in range(25):
+        # Paths are finished in groups so each group gets its own colours
+        shape = page.new_shape()
+        for _ in range(12):
+            shape.draw_line(point(), point())
+        for _ in range(4):
+            shape.draw_bezier(point(), point(), point(), point())
+        shape.finish(color=(rng.random(), rng.random(), rng.random()), width=rng.uniform(0.2, 2))
+        for _ in range(4):
+            corner = point()
+            shape.draw_rect(fitz.Rect(corner, corner + (rng.uniform(5, 80), rng.uniform(5, 80))))
+        shape.finish(color=(0, 0, 0), fill=(rng.random(), rng.random(), rng.random()), width=0.5)
+        shape.commit()
+
+
+def _scan_images(rng):
+    width, height = PAGE_WIDTH * SCAN_DPI // 72, PAGE_HEIGHT * SCAN_DPI // 72
+    return [fitz.Pixmap(fitz.csGRAY, width, height, rng.randbytes(width * height), False)
+            for _ in range(SCAN_IMAGES)]
+
+
+def generate_pdf(kind, pages, path, seed=0):
+    """Write a PDF of pages pages of the given kind to path."""
+    if kind not in KINDS:
+        raise ValueError(f"unknown kind {kind!r}, expected one of {KINDS}")
+    rng = random.Random(seed)
+    doc = fitz.open()
+    if kind == "scanned":
+        images = _scan_images(rng)
+        xrefs = []
+        for i in range(pages):
+            page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            # Each image is stored once and referenced by the later pages
+            if i < len(images):
+                xrefs.append(page.insert_image(page.rect, pixmap=images[i]))
+            else:
+                page.insert_image(page.rect, xref=xrefs[i % len(xrefs)])
+    else:
+        make_page = _text_page if kind == "text" else _vector_page
+        for _ in range(pages):
+            make_page(doc, rng)
+    doc.save(path, garbage=1, deflate=True)
+    doc.close()
+
+
+def ensure_pdf(kind, pages):
+    """Return the path of a cached synthetic PDF, generating it on first use."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, f"{kind}-{pages}-v{GENERATOR_VERSION}.pdf")
+    if not os.path.exists(path):
+        partial_path = path + ".part"
+        generate_pdf(kind, pages, partial_path)
+        os.replace(partial_path, path)
+    return path
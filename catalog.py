@@ -0,0 +1,147 @@
+import os
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+
+from app_paths import ThreadConnections, data_path, normalize_path
+
+
+# Width in pixels of the first-page thumbnails stored in the catalog.
+THUMBNAIL_WIDTH = 96
+# Rows written per transaction while scanning.
+SCAN_COMMIT_EVERY = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdfs (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    page_count INTEGER,
+    title TEXT,
+    thumbnail BLOB
+);
+"""
+
+CatalogEntry = namedtuple("CatalogEntry", "path size mtime page_count title")
+
+
+def walk_pdfs(folder):
+    """Yield (path, size, mtime) for every PDF below folder, using os.scandir."""
+    pending = [folder]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.name.lower().endswith(".pdf"):
+                            stat = entry.stat()
+                            yield entry.path, stat.st_size, stat.st_mtime
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+def read_pdf_metadata(path):
+    """Return (page count, title, PNG thumbnail of the first page) for one PDF."""
+    with fitz.open(path) as doc:
+        title = (doc.metadata or {}).get("title") or None
+        thumbnail = None
+        if len(doc):
+            page = doc[0]
+            scale = THUMBNAIL_WIDTH / page.rect.width
+            thumbnail = page.get_pixmap(matrix=fitz.Matrix(scale, scale)).tobytes("png")
+        return len(doc), title, thumbnail
+
+
+class LibraryCatalog:
+    """Persistent SQLite catalog of the PDFs in the library folders.
+
+    scan() only re-reads files whose size or mtime changed since the last scan, so
+    reopening a folder is answered from the database straight away.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or data_path("catalog.sqlite3")
+        self._db = ThreadConnections(self.db_path)
+        db = self._db.get()
+        db.executescript(SCHEMA)
+        db.commit()
+
+    @staticmethod
+    def _prefix(folder):
+        return os.path.join(normalize_path(folder), "")
+
+    def entries(self, folder):
+        """Return the catalogued PDFs below folder, without their thumbnails."""
+        prefix = self._prefix(folder)
+        rows = self._db.get().execute(
+            "SELECT path, size, mtime, page_count, title FROM pdfs WHERE substr(path, 1, ?) = ?",
+            (len(prefix), prefix))
+        return [CatalogEntry(*row) for row in rows]
+
+    def entry(self, path):
+        row = self._db.get().execute(
+            "SELECT path, size, mtime, page_count, title FROM pdfs WHERE path = ?",
+            (normalize_path(path),)).fetchone()
+        return CatalogEntry(*row) if row else None
+
+    def thumbnails(self, paths):
+        """Return {path: PNG bytes} for the given paths that have a thumbnail, keyed as given."""
+        db = self._db.get()
+        result = {}
+        for path in paths:
+            row = db.execute("SELECT thumbnail FROM pdfs WHERE path = ?", (normalize_path(path),)).fetchone()
+            if row and row[0]:
+                result[path] = row[0]
+        return result
+
+    def scan(self, folder, on_updated=None, on_removed=None, should_stop=None):
+        """Bring the catalog for folder up to date with the files on disk.
+
+        on_updated receives a CatalogEntry per (re)read file and on_removed the
+        path of each file that disappeared.
+        """
+        folder = normalize_path(folder)
+        db = self._db.get()
+        known = {entry.path: entry for entry in self.entries(folder)}
+
+        # Paths are stored normalized, see normalize_path
+        found = [(normalize_path(path), size, mtime) for path, size, mtime in walk_pdfs(folder)]
+
+        for path in set(known) - {path for path, _, _ in found}:
+            db.execute("DELETE FROM pdfs WHERE path = ?", (path,))
+            if on_removed is not None:
+                on_removed(path)
+        db.commit()
+
+        # Entries are reported once committed, so other connections can read them
+        pending = []
+        for path, size, mtime in found:
+            if should_stop is not None and should_stop():
+                break
+            entry = known.get(path)
+            if entry is not None and entry.size == size and entry.mtime == mtime:
+                continue
+            try:
+                page_count, title, thumbnail = read_pdf_metadata(path)
+            except Exception as e:
+                # Damaged or encrypted files are still listed, just without metadata
+                print(e)
+                page_count, title, thumbnail = None, None, None
+            db.execute("INSERT OR REPLACE INTO pdfs VALUES (?, ?, ?, ?, ?, ?)",
+                       (path, size, mtime, page_count, title, thumbnail))
+            pending.append(CatalogEntry(path, size, mtime, page_count, title))
+            if len(pending) >= SCAN_COMMIT_EVERY:
+                self._commit(pending, on_updated)
+                pending = []
+        self._commit(pending, on_updated)
+
+    def _commit(self, entries, on_updated):
+        self._db.get().commit()
+        if on_updated is not None:
+            for entry in entries:
+                on_updated(entry)
@@ -0,0 +1,109 @@
+import threading
+
+from retrieval import estimate_tokens
+
+
+# Tokens the earlier turns sent with a follow-up may use, and the part of it kept for
+# the summary of the turns that no longer fit.
+HISTORY_TOKEN_BUDGET = 4000
+SUMMARY_TOKEN_BUDGET = 600
+# Characters of a dropped question and of its answer kept in the summary.
+SUMMARY_QUESTION_CHARS = 160
+SUMMARY_ANSWER_CHARS = 240
+
+SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+CUT_MARKER = "\n[... cut to fit the conversation budget]"
+SUMMARY_REPLY = "Understood."
+
+
+def _clip(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def _shorten(text, tokens):
+    # Keep the start of text within about tokens tokens, marking the cut
+    if estimate_tokens(text) <= tokens:
+        return text
+    return text[:max(0, tokens * 4 - len(CUT_MARKER))] + CUT_MARKER
+
+
+def history_parts(history):
+    """Return the roles and texts of history as a flat list, e.g. to key a cached answer on it."""
+    return [text for content in history for text in [content["role"]] + content["parts"]]
+
+
+class ChatSession:
+    """The turns of one conversation with the AI, capped to a token budget.
+
+    Each turn is stored as the text actually sent and the answer received. A
+    follow-up only carries what changed: the code is left out when it matches
+    the previous turn. Once the stored turns pass the history budget, the
+    oldest are folded into a short summary of what was asked and answered,
+    and the oldest summary lines go once that passes its own budget; a turn
+    over the history budget on its own is cut down to it. So the size of a
+    request stays flat however long the chat gets and whatever was sent.
+    """
+
+    def __init__(self, history_budget=HISTORY_TOKEN_BUDGET, summary_budget=SUMMARY_TOKEN_BUDGET):
+        self.history_budget = history_budget
+        self.summary_budget = summary_budget
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every turn, starting a new conversation."""
+        with self._lock:
+            self._turns = []
+            self._summary = []
+            self._code = None
+
+    def __len__(self):
+        return len(self._turns) + bool(self._summary)
+
+    def message(self, command, code, passages=""):
+        """Return the text to send for a new turn, leaving out what the history already holds."""
+        with self._lock:
+            parts = [passages, command]
+            if code != self._code or not self._turns:
+                parts.append("\n" + code)
+            return "".join(parts)
+
+    def history(self):
+        """Return the earlier turns as the role/parts contents the Gemini chat expects."""
+        with self._lock:
+            contents = []
+            if self._summary:
+                contents.append({"role": "user", "parts": [SUMMARY_HEADER + "\n".join(self._summary)]})
+                contents.append({"role": "model", "parts": [SUMMARY_REPLY]})
+            for sent, answer, _ in self._turns:
+                contents.append({"role": "user", "parts": [sent]})
+                contents.append({"role": "model", "parts": [answer]})
+            return contents
+
+    def record(self, command, code, sent, answer):
+        """Store a completed turn, then trim the history back under its budget."""
+        with self._lock:
+            self._code = code
+            self._turns.append((sent, answer, command))
+            self._trim()
+
+    def _trim(self):
+        used = sum(estimate_tokens(sent) + estimate_tokens(answer) for sent, answer, _ in self._turns)
+        while len(self._turns) > 1 and used > self.history_budget:
+            sent, answer, command = self._turns.pop(0)
+            used -= estimate_tokens(sent) + estimate_tokens(answer)
+            question = command or sent
+            self._summary.append(f"- Asked: {_clip(question, SUMMARY_QUESTION_CHARS)} "
+                                 f"Answered: {_clip(answer, SUMMARY_ANSWER_CHARS)}")
+        # The newest turn stays, cut down when it alone is over budget, e.g. a whole file sent in parts
+        if used > self.history_budget:
+            sent, answer, command = self._turns[0]
+            answer = _shorten(answer, self.history_budget // 2)
+            sent = _shorten(sent, self.history_budget - estimate_tokens(answer))
+            self._turns[0] = (sent, answer, command)
+        # Once the turn that carried the code is gone, the next turn sends it again
+        if self._code and not any(self._code in sent for sent, _, _ in self._turns):
+            self._code = None
+        while len(self._summary) > 1 and estimate_tokens("\n".join(self._summary)) > self.summary_budget:
+            self._summary.pop(0)
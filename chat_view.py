@@ -0,0 +1,133 @@
+import re
+
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtGui import (QGuiApplication, QTextBlockFormat, QTextCharFormat, QTextCursor,
+                         QTextDocument, QTextDocumentFragment)
+
+
+# Display refresh rate assumed when the screen does not report one.
+DEFAULT_REFRESH_RATE = 60
+
+
+# Lines that may continue the block before a blank line: list items, quotes and indented lines.
+_CONTINUATION = re.compile(r"\s|[-*+>]|\d+[.)]")
+
+
+def closed_length(text):
+    """Return how much of a markdown text is made of finished blocks.
+
+    A block is finished at a blank line outside a fenced code block that is
+    followed by a line starting a new block. A line that is a list item, a
+    quote or indented may still belong to the list, quote or code before the
+    blank line, which then stays open. Text after the last finished block may
+    still change as more of the answer arrives.
+    """
+    position = 0
+    end = 0
+    blank_end = None
+    in_fence = False
+    for line in text.splitlines(keepends=True):
+        if not line.endswith("\n"):
+            break
+        stripped = line.strip()
+        if blank_end is not None and stripped and not in_fence:
+            if not _CONTINUATION.match(line):
+                end = blank_end
+            blank_end = None
+        if stripped.startswith("```") or stripped.startswith("~~~"):
+            in_fence = not in_fence
+        elif not stripped and not in_fence:
+            blank_end = position + len(line)
+        position += len(line)
+    return end
+
+
+class MarkdownStream(QObject):
+    """Streams a markdown answer into a QTextEdit a few pieces at a time.
+
+    Appended text is rendered at most once per display frame. Finished blocks
+    are rendered once and kept; only the block still being written is parsed
+    again on each frame, so a long answer costs linear time to show. finish()
+    renders the whole answer once more, so the final view is exactly what
+    setMarkdown gives.
+    """
+
+    def __init__(self, text_edit):
+        super().__init__(text_edit)
+        self.text_edit = text_edit
+        self._open = ""
+        self._text = ""
+        self._frozen = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        screen = QGuiApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None else 0
+        self._timer.setInterval(round(1000 / (refresh_rate or DEFAULT_REFRESH_RATE)))
+        self._timer.timeout.connect(self.flush)
+
+    def begin(self):
+        """Clear the view for a new answer."""
+        self._timer.stop()
+        self.text_edit.clear()
+        self._open = ""
+        self._text = ""
+        self._frozen = 0
+
+    def append(self, text):
+        self._open += text
+        self._text += text
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def finish(self):
+        """Render the whole answer received so far straight away."""
+        self._timer.stop()
+        bar = self.text_edit.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum() - 4
+        position = bar.value()
+        self.text_edit.setMarkdown(self._text)
+        self._open = ""
+        self._frozen = self.text_edit.document().characterCount() - 1
+        bar.setValue(bar.maximum() if at_bottom else position)
+
+    def flush(self):
+        bar = self.text_edit.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum() - 4
+
+        closed = closed_length(self._open)
+        if closed:
+            self._replaceOpenBlock(self._open[:closed])
+            self._frozen = self.text_edit.document().characterCount() - 1
+            self._open = self._open[closed:]
+        self._replaceOpenBlock(self._open)
+
+        if at_bottom:
+            bar.setValue(bar.maximum())
+
+    def _replaceOpenBlock(self, markdown):
+        cursor = QTextCursor(self.text_edit.document())
+        cursor.setPosition(self._frozen)
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        if not markdown.strip():
+            return
+        if self._frozen:
+            # Start from plain formats rather than those of the last finished block
+            cursor.insertBlock(QTextBlockFormat(), QTextCharFormat())
+        start = cursor.position()
+        document = QTextDocument()
+        document.setMarkdown(markdown)
+        cursor.insertFragment(QTextDocumentFragment(document))
+        # The first block of a fragment takes the format of the block it goes into;
+        # give it back its own, such as a heading level or a quote indent
+        first = document.firstBlock()
+        if first.textList() is None:
+            cursor.setPosition(start)
+            cursor.setBlockFormat(first.blockFormat())
+        if self._frozen:
+            # A fragment starting with a list goes in after the new block instead of
+            # into it; drop the empty block that leaves behind
+            separator = self.text_edit.document().findBlock(self._frozen + 1)
+            if separator.length() == 1 and separator.next().isValid():
+                cursor.setPosition(separator.position())
+                cursor.deletePreviousChar()
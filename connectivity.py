@@ -0,0 +1,96 @@
+import socket
+import threading
+import time
+
+import requests
+from google.api_core import exceptions as google_exceptions
+
+
+# Endpoint whose reachability stands for "online": the Gemini API itself. Any HTTP
+# answer counts, so no API key is needed.
+PROBE_URL = "https://generativelanguage.googleapis.com/"
+PROBE_TIMEOUT = 2.0
+# Seconds a probe or request outcome is trusted before it is checked again.
+STATUS_TTL = 30.0
+
+OFFLINE_MESSAGE = "No Internet Connection.Please Connect to Internet"
+ERROR_MESSAGES = {
+    "offline": OFFLINE_MESSAGE,
+    "timeout": "The AI service did not answer in time, please try again.",
+    "quota": "The AI request limit was reached, please wait a moment and try again.",
+    "auth": "The API key was rejected, please check API_KEY in the .env file.",
+}
+
+
+class ConnectivityMonitor:
+    """Cached answer to "can the Gemini API be reached?", for display only.
+
+    The state comes from an HTTPS probe run on a background thread, and from
+    the outcome of real requests reported with report(). It expires after ttl
+    seconds, so nothing ever waits for a probe. The probe goes through the
+    proxy set in HTTPS_PROXY or the system settings, like the Gemini client.
+    Requests are sent whatever the state says.
+    """
+
+    def __init__(self, url=PROBE_URL, ttl=STATUS_TTL):
+        self.url = url
+        self.ttl = ttl
+        self._online = None
+        self._checked = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def is_online(self):
+        """Return True or False while the state is fresh, None when unknown or expired.
+
+        An expired state starts a background probe.
+        """
+        with self._lock:
+            fresh = self._checked is not None and time.monotonic() - self._checked < self.ttl
+            online = self._online
+        if not fresh:
+            self.refresh()
+            return None
+        return online
+
+    def refresh(self):
+        """Probe in the background unless a probe is already running."""
+        with self._lock:
+            if self._probing:
+                return
+            self._probing = True
+        threading.Thread(target=self._probe, daemon=True).start()
+
+    def _probe(self):
+        try:
+            requests.head(self.url, timeout=PROBE_TIMEOUT).close()
+            online = True
+        except requests.RequestException:
+            online = False
+        with self._lock:
+            self._probing = False
+        self.report(online)
+
+    def report(self, online):
+        with self._lock:
+            self._online = online
+            self._checked = time.monotonic()
+
+
+def classify_error(error):
+    """Return (kind, message) for an exception raised by a Gemini request.
+
+    kind is one of "offline", "timeout", "quota", "auth" or "error".
+    """
+    if isinstance(error, (google_exceptions.DeadlineExceeded, requests.Timeout, socket.timeout, TimeoutError)):
+        kind = "timeout"
+    elif isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        kind = "quota"
+    elif isinstance(error, (google_exceptions.PermissionDenied, google_exceptions.Unauthenticated)) or (
+            isinstance(error, google_exceptions.InvalidArgument) and "api key" in str(error).lower()):
+        kind = "auth"
+    elif isinstance(error, (google_exceptions.ServiceUnavailable, requests.ConnectionError, OSError)):
+        kind = "offline"
+    else:
+        return "error", f"The AI request failed: {error}"
+    return kind, ERROR_MESSAGES[kind]
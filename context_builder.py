@@ -0,0 +1,352 @@
+"""Pick the part of the editor buffer worth sending with an AI request.
+
+Instead of the whole file, a request carries the selection or the function or
+class around the cursor, plus the imports and the signatures of the names it
+uses, within a token budget. Python is read with ast (falling back to
+indentation when the buffer does not parse); C and C++ with a small scanner
+that skips strings, comments and preprocessor lines and matches braces.
+"""
+import ast
+import bisect
+import os
+import re
+from collections import namedtuple
+
+from retrieval import estimate_tokens
+
+
+# Tokens the code part of a request may use.
+CODE_TOKEN_BUDGET = 3000
+# Tokens of a part when a whole file is sent in parts; smaller top-level units are grouped up to it.
+UNIT_TOKEN_BUDGET = 800
+# Module-level assignments longer than this many lines are not copied as context.
+MAX_CONSTANT_LINES = 3
+
+PYTHON_EXTENSIONS = (".py", ".pyw")
+C_EXTENSIONS = (".c", ".h", ".cpp", ".cc", ".cxx", ".hpp", ".hh")
+
+C_KEYWORDS = {"if", "for", "while", "switch", "return", "sizeof", "do", "else", "case", "catch",
+              "struct", "class", "namespace", "enum", "union", "typedef", "extern", "new", "delete"}
+
+# text is what gets sent, description says what it is, for the status label.
+CodeContext = namedtuple("CodeContext", "text tokens description")
+
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+_ACCESS_LABEL = re.compile(r"^\s*(public|private|protected)\s*:")
+_LEADING_SPACE = re.compile(r"\s*")
+_LINE = re.compile(r"[^\n]*\n|[^\n]+")
+# Block headers whose closing brace takes a semicolon, unlike namespaces and functions
+_C_TYPE_HEADER = re.compile(r"\b(class|struct|union|enum)\b")
+
+
+def build_context(source, file_path="", selection="", cursor_line=0, token_budget=CODE_TOKEN_BUDGET):
+    """Return the CodeContext to send for source with the cursor on cursor_line (0-based)."""
+    extension = os.path.splitext(file_path or "")[1].lower()
+    if extension in PYTHON_EXTENSIONS:
+        parts = _python_parts(source, selection, cursor_line)
+    elif extension in C_EXTENSIONS:
+        parts = _c_parts(source, selection, cursor_line)
+    else:
+        parts = ([], selection or source, "selection" if selection else "whole file")
+    return _fit(*parts, token_budget)
+
+
+def split_units(source, file_path="", unit_budget=UNIT_TOKEN_BUDGET):
+    """Split source into consecutive parts at top-level function and class boundaries.
+
+    The parts joined together give back source. Neighbouring units are grouped
+    while they fit unit_budget tokens; a unit larger than that is a part alone.
+    """
+    extension = os.path.splitext(file_path or "")[1].lower()
+    lines = _split_lines(source)
+    starts = None
+    if extension in PYTHON_EXTENSIONS:
+        try:
+            starts = _python_unit_starts(lines, ast.parse(source).body, unit_budget)
+        except SyntaxError:
+            pass
+    elif extension in C_EXTENSIONS:
+        starts = _c_unit_starts(source, unit_budget)
+    if starts is None:
+        # Unknown or unparsable: a line at column 0 after a blank line starts a unit
+        starts = [i for i in range(1, len(lines))
+                  if lines[i].strip() and not lines[i][0].isspace() and not lines[i - 1].strip()]
+
+    bounds = sorted(set(start for start in starts if 0 < start < len(lines)))
+    units = ["".join(lines[start:end]) for start, end in zip([0] + bounds, bounds + [len(lines)])]
+    parts = []
+    for unit in units:
+        if parts and estimate_tokens(parts[-1] + unit) <= unit_budget:
+            parts[-1] += unit
+        else:
+            parts.append(unit)
+    return [part for part in parts if part.strip()] or [source]
+
+
+def _python_unit_starts(lines, body, unit_budget):
+    # Top-level definitions, and those of a class too large to be one unit
+    starts = []
+    for node in _definitions(body):
+        starts.append(_node_start(node) - 1)
+        if isinstance(node, ast.ClassDef) and \
+                estimate_tokens("".join(lines[_node_start(node) - 1:node.end_lineno])) > unit_budget:
+            starts.extend(_python_unit_starts(lines, node.body, unit_budget))
+    return starts
+
+
+def _c_unit_starts(source, unit_budget):
+    # Top-level blocks, and the blocks inside a class or namespace too large to be one unit
+    offsets = _line_offsets(source)
+    blocks = c_blocks(source)
+    large = [block for block in blocks if estimate_tokens(source[block[0]:block[2]]) > unit_budget]
+    starts = []
+    for header_start, _, end, depth in blocks:
+        if depth == 0 or any(outer[3] == depth - 1 and outer[1] < header_start and end <= outer[2]
+                             and c_function_name(source[outer[0]:outer[1]]) is None for outer in large):
+            first = _LEADING_SPACE.match(source, header_start).end()
+            starts.append(bisect.bisect_right(offsets, first) - 1)
+    return starts
+
+
+def _split_lines(source):
+    # Only "\n" ends a line, as for the ast line numbers; splitlines() also breaks at
+    # form feeds, "\u2028" and the like
+    return _LINE.findall(source)
+
+
+def _fit(extras, target, description, token_budget):
+    # The target goes first; the extras are added in order while they fit
+    if estimate_tokens(target) > token_budget:
+        kept = target[:token_budget * 4]
+        description += f", cut to its first {len(_split_lines(kept))} of {len(_split_lines(target))} lines"
+        target = kept + "\n... (truncated)\n"
+    used = estimate_tokens(target)
+    kept = []
+    for extra in extras:
+        cost = estimate_tokens(extra)
+        if used + cost <= token_budget:
+            kept.append(extra)
+            used += cost
+    text = "".join(part if part.endswith("\n") else part + "\n" for part in kept + [target])
+    return CodeContext(text, estimate_tokens(text), description)
+
+
+def _line_offsets(source):
+    offsets = [0]
+    for line in _split_lines(source):
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
+# Python
+
+def _node_start(node):
+    return min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+
+
+def _definitions(body):
+    return [node for node in body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))]
+
+
+def _enclosing_definition(tree, line):
+    # Innermost def or class around the 1-based line, with the classes it sits in
+    chain = []
+    body = tree.body
+    while True:
+        for node in _definitions(body):
+            if _node_start(node) <= line <= node.end_lineno:
+                chain.append(node)
+                body = node.body
+                break
+        else:
+            return chain
+
+
+def _header_lines(lines, node):
+    # Decorators and signature, up to the first statement of the body
+    first = node.body[0]
+    header = "".join(lines[_node_start(node) - 1:first.lineno - 1])
+    # col_offset counts UTF-8 bytes
+    before = lines[first.lineno - 1].encode()[:first.col_offset].decode()
+    if before.strip():
+        # The body starts on the signature line, as in "def f(x: int) -> str: return str(x)"
+        header += before.rstrip() + "\n"
+    return header
+
+
+def _header(lines, node):
+    indent = re.match(r"\s*", lines[node.lineno - 1]).group()
+    return _header_lines(lines, node) + indent + "    ...\n"
+
+
+def _signature(lines, node):
+    methods = _definitions(node.body) if isinstance(node, ast.ClassDef) else []
+    if methods:
+        return _header_lines(lines, node) + "".join(_header(lines, method) for method in methods)
+    return _header(lines, node)
+
+
+def _used_names(node_or_text):
+    if isinstance(node_or_text, str):
+        return set(_IDENTIFIER.findall(node_or_text))
+    names = set()
+    for node in ast.walk(node_or_text):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            names.add(node.attr)
+    return names
+
+
+def _python_parts(source, selection, cursor_line):
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return _indented_parts(source, selection, cursor_line)
+    lines = _split_lines(source)
+
+    chain = [] if selection else _enclosing_definition(tree, cursor_line + 1)
+    if selection:
+        target, description, used = selection, "selection", _used_names(selection)
+        # Definitions made inside the selection need no signature
+        used -= set(re.findall(r"(?:def|class)\s+(\w+)", selection))
+    elif chain:
+        node = chain[-1]
+        target = "".join(lines[_node_start(node) - 1:node.end_lineno])
+        # A method is sent with the headers of the classes around it
+        target = "".join(_header_lines(lines, outer) for outer in chain[:-1]) + target
+        kind = "class" if isinstance(node, ast.ClassDef) else "function"
+        description, used = f"{kind} {node.name}", _used_names(node)
+        for outer in chain[:-1]:
+            for base in outer.bases + outer.decorator_list:
+                used |= _used_names(base)
+    else:
+        return [], source, "whole file"
+
+    imports, constants, signatures = [], [], []
+    enclosing = {id(node) for node in chain}
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            aliases = [alias for alias in node.names
+                       if (alias.asname or alias.name.split(".")[0]) in used or alias.name == "*"]
+            if aliases:
+                trimmed = ast.ImportFrom(node.module, aliases, node.level) if isinstance(node, ast.ImportFrom) \
+                    else ast.Import(aliases)
+                imports.append(ast.unparse(trimmed) + "\n")
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = {target.id for target in targets if isinstance(target, ast.Name)}
+            if names & used and node.end_lineno - node.lineno < MAX_CONSTANT_LINES:
+                constants.append("".join(lines[node.lineno - 1:node.end_lineno]))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if node.name in used and id(node) not in enclosing:
+                signatures.append(_signature(lines, node))
+    return imports + constants + signatures, target, description
+
+
+def _indented_parts(source, selection, cursor_line):
+    # Used while the buffer does not parse: the def or class block by indentation
+    if selection:
+        return [], selection, "selection"
+    lines = _split_lines(source)
+    header = re.compile(r"(\s*)(async\s+def|def|class)\s+(\w+)")
+    for start in range(min(cursor_line, len(lines) - 1), -1, -1):
+        match = header.match(lines[start])
+        if match:
+            indent = len(match.group(1))
+            end = start + 1
+            while end < len(lines) and (not lines[end].strip() or
+                                        len(lines[end]) - len(lines[end].lstrip()) > indent):
+                end += 1
+            if end > cursor_line:
+                imports = [line for line in lines if re.match(r"(from\s+\S+\s+)?import\s", line)]
+                kind = "class" if match.group(2) == "class" else "function"
+                return imports, "".join(lines[start:end]), f"{kind} {match.group(3)}"
+    return [], source, "whole file"
+
+
+# C and C++
+
+def c_blocks(source):
+    """Return (header start, body start, end, depth) for every {...} block of C/C++ source.
+
+    Strings, character literals, comments and preprocessor lines are skipped.
+    """
+    blocks = []
+    stack = []
+    statement_start = 0
+    i = 0
+    n = len(source)
+    while i < n:
+        char = source[i]
+        if char in "\"'":
+            i += 1
+            while i < n and source[i] != char:
+                i += 2 if source[i] == "\\" else 1
+        elif source.startswith("//", i):
+            i = source.find("\n", i)
+            i = n if i < 0 else i
+            statement_start = i
+        elif source.startswith("/*", i):
+            i = source.find("*/", i + 2)
+            i = n if i < 0 else i + 1
+            statement_start = i + 1
+        elif char == "#" and not source[source.rfind("\n", 0, i) + 1:i].strip():
+            # Preprocessor line, with backslash continuations
+            while i < n and source[i] != "\n":
+                i += 2 if source[i] == "\\" else 1
+            statement_start = i
+        elif char == "{":
+            stack.append((statement_start, i))
+            statement_start = i + 1
+        elif char == "}" and stack:
+            header_start, body_start = stack.pop()
+            blocks.append((header_start, body_start, i + 1, len(stack)))
+            statement_start = i + 1
+        elif char == ";":
+            statement_start = i + 1
+        i += 1
+    return blocks
+
+
+def c_function_name(header):
+    """Return the name of the function a block header declares, or None."""
+    header = re.sub(r"\s+", " ", header).strip()
+    match = re.search(r"([A-Za-z_][\w:~]*)\s*\(", header)
+    if match is None or "=" in header[:match.start()]:
+        return None
+    name = match.group(1).split("::")[-1]
+    first_word = header.split(" ", 1)[0]
+    if name in C_KEYWORDS or first_word in C_KEYWORDS:
+        return None
+    return name
+
+
+def _c_parts(source, selection, cursor_line):
+    includes = [line + "\n" for line in source.split("\n") if re.match(r"\s*#\s*include\b", line)]
+    blocks = c_blocks(source)
+    functions = [(block, c_function_name(source[block[0]:block[1]])) for block in blocks]
+    functions = [(block, name) for block, name in functions if name]
+
+    if selection:
+        target, description = selection, "selection"
+        own = None
+    else:
+        offset = _line_offsets(source)[min(cursor_line, source.count("\n"))]
+        around = [(block, name) for block, name in functions if block[0] <= offset < block[2]]
+        if not around:
+            return [], source, "whole file"
+        own, name = max(around, key=lambda item: item[0][3])
+        target = _ACCESS_LABEL.sub("", source[own[0]:own[2]]).strip("\n") + "\n"
+        # A method is sent inside the class, struct or namespace blocks around it
+        for block in sorted((block for block in blocks if block[0] < own[0] and own[2] <= block[2]),
+                            key=lambda block: block[3], reverse=True):
+            header = _ACCESS_LABEL.sub("", source[block[0]:block[1]]).strip()
+            end = "};" if _C_TYPE_HEADER.search(header) else "}"
+            target = f"{header} {{\n{target}{end}\n"
+        description = f"function {name}"
+
+    called = set(re.findall(r"([A-Za-z_]\w*)\s*\(", target))
+    signatures = [_ACCESS_LABEL.sub("", source[block[0]:block[1]]).strip() + ";\n"
+                  for block, name in functions if name in called and block != own]
+    return includes + signatures, target, description
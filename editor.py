@@ -36,14 +36,12 @@ from PyQt5.QtWidgets import (
 
     QHBoxLayout,
 
-    QTreeWidget,
-
-    QTreeWidgetItem,
-
     QDockWidget,
 
     QComboBox,
 
+    QCheckBox,
+
 )  # Importing various PyQt5.QtWidgets modules for creating GUI elements like windows, layouts, buttons, text editors, etc.
 
 
@@ -70,8 +68,30 @@ from PyQt5.Qsci import (
 )
 
 
+from file_tree import LazyFileTree  # Importing the lazily listed file tree shared with the library.
+
+from connectivity import ConnectivityMonitor, classify_error  # Importing the cached connectivity state.
+
+from chat_view import MarkdownStream  # Importing the incremental markdown renderer for the chat area.
+
+from ai_requests import AiRequestManager, RequestCancelled  # Importing the manager of concurrent Gemini calls.
+
+from chat_session import ChatSession, history_parts  # Importing the bounded history of the AI conversation.
+
+from context_builder import build_context, split_units  # Importing the selection of the code sent with a request.
+
+from response_cache import ResponseCache, response_key  # Importing the cache of AI answers.
+
+from prompt_registry import PromptRegistry  # Importing the prompt commands and their templates.
+
+from retrieval import Retriever, estimate_tokens, format_passages  # Importing the local passage retrieval over the library PDFs.
+
+from app_paths import is_inside  # Importing the drive-safe check of whether a file is inside a folder.
+
 import google.generativeai as gemini  # Importing the Google Gemini AI library.
 
+from google.generativeai import caching  # Importing Gemini context caching for long instructions.
+
 from dotenv import load_dotenv,dotenv_values #loading to use .env
 
 import os  # Importing the os module for operating system functionalities.
@@ -81,8 +101,15 @@ import platform  # Importing the platform module for system functionalities.
 # Importing the subprocess module for running external commands.
 import subprocess
 
-#to check internet connection
-import requests
+import queue  # Importing the queue module for the AI request queue.
+
+import threading  # Importing threading to guard the state shared with the AI worker.
+
+from collections import namedtuple  # Importing namedtuple to describe AI requests.
+
+import time  # Importing the time module to measure the time to first token.
+
+import datetime  # Importing datetime for the lifetime of Gemini context caches.
 
 import shutil  # Importing the shutil module for high-level file operations.
 
@@ -108,56 +135,403 @@ def resource_path(relative_path):
 
 
 
-# Defining a class GeminiThreat that inherits from QThread for handling AI operations in a separate thread.
-class GeminiThreat(QThread):
+# Parts of an AI request: the prompt template goes as the model's system instruction, the user's command
+# and the editor code as the message; the retriever adds library passages and use_cache allows replaying
+# a cached answer. units, when set, are the parts of a whole file, each asked about on its own.
+AiRequest = namedtuple('AiRequest', 'template command code retriever use_cache units', defaults=(None,))
+
+# Prompt commands that can be run over a whole file in parts.
+SPLIT_COMMANDS = ('explain', 'comment')
+
+# Seconds a Gemini answer may take to stream before it is abandoned.
+AI_REQUEST_TIMEOUT = 120
+
+# Smallest instructions Gemini accepts as a context cache, and how long a cache is kept, in seconds.
+CONTEXT_CACHE_MIN_TOKENS = 4096
+CONTEXT_CACHE_TTL = 3600
+
+# Queued on the AI worker to start a new conversation.
+NEW_CHAT = object()
+
+# Extensions of the files shown in the editor's file tree.
+EDITOR_EXTENSIONS = ('.py', '.c', '.cpp', '.txt', '.md', '.html', '.css', '.js')
+
 
-    # Defining a pyqtSignal to emit progress updates as strings.
-    progress = pyqtSignal(str)
+# Defining a class GeminiWorker: one long-lived thread that answers the latest AI request.
+class GeminiWorker(QThread):
 
-    # Constructor for GeminiThreat, takes chat area and input string as arguments.
-    def __init__(self, chat_area: QTextEdit, text: str):
+    # Defining a pyqtSignal emitted with the generation of an answer when it starts.
+    answer_started = pyqtSignal(int)
+
+    # Defining a pyqtSignal to emit each new piece of the answer as it streams in, with its generation.
+    progress = pyqtSignal(int, str)
+
+    # Defining a pyqtSignal emitted with the generation of an answer when it is complete.
+    answer_finished = pyqtSignal(int)
+
+    # Defining a pyqtSignal to emit the milliseconds from a request to its first token.
+    first_token = pyqtSignal(float)
+
+    # Constructor for GeminiWorker, takes the GeminiAi instance shared by all requests.
+    def __init__(self, ai):
 
         # Calling the superclass constructor to initialize the QThread.
-        super(QThread, self).__init__()
+        super().__init__()
 
-        # Assigning the chat area widget to the instance.
-        self.chat_area = chat_area
+        # Reusing one GeminiAi, so the client is configured and the model built only once.
+        self.ai = ai
 
-        self.input_text = text  # Assigning the input text to the instance.
+        # Creating the queue of pending requests with the generation they were sent in; None asks the thread to stop.
+        self._requests = queue.Queue()
 
-        # self.finished = pyqtSignal() #commented out: Unnecessary signal, QThread already has finished signal.
+        # Creating the manager running the Gemini calls, which shares, caps, retries and cancels them.
+        self.manager = AiRequestManager()
 
-        # Initializing GeminiAi object with API key and model.
-        self.ai = GeminiAi(API_KEY, AI_MODEL)
-    def check_internet_connection(self):
-        try:
-            response = requests.get("https://google.com", timeout=5)
-            return True
-        except requests.ConnectionError:
-            return False
+        # Guarding the generation, the request being answered and its subscription, shared with the UI thread.
+        self._lock = threading.Lock()
+
+        # Counting superseded requests; queued requests of an older generation are dropped.
+        self._generation = 0
+
+        self._answering = None  # Keeping the request being answered, to merge an identical one.
 
-    # Defining the run method, which is executed when the thread starts.
+        self._subscriptions = []  # Keeping the streams being read, to cancel them.
+
+        # Creating the cached connectivity state, probed in the background and only shown; requests are always tried.
+        self.connectivity = ConnectivityMonitor()
+
+        self.connectivity.refresh()  # Starting the first background probe.
+
+        # Creating the cache of answers by request content, in memory and on disk.
+        self.cache = ResponseCache()
+
+        self.last_from_cache = False  # Tracking whether the last answer was replayed from the cache.
+
+        # Creating the conversation, whose earlier turns are sent with each follow-up.
+        self.session = ChatSession()
+
+    # Method to queue an AiRequest, superseding the one being answered unless it is the same request.
+    def submit(self, request):
+
+        with self._lock:
+
+            # Merging a repeated Send into the answer already streaming.
+            if request == self._answering:
+                return
+
+            generation = self._supersede()
+
+        self._requests.put((generation, request))
+
+    # Method to stop the answer being streamed and drop the queued requests.
+    def cancel(self):
+
+        with self._lock:
+            self._supersede()
+
+    # Method to start a new conversation, dropping the answer in progress; returns the generation the new
+    # conversation starts at, the answers of older generations belonging to the previous one.
+    def newChat(self):
+
+        with self._lock:
+            generation = self._supersede()
+
+        self._requests.put(NEW_CHAT)
+
+        return generation
+
+    # Method to move to a new generation, cancelling the stream being read; called with the lock held.
+    def _supersede(self):
+
+        self._generation += 1
+
+        self._answering = None
+
+        for subscription in self._subscriptions:
+            subscription.cancel()  # Ending the stream at once; its call is abandoned.
+
+        return self._generation
+
+    # Method to stop the thread, abandoning the current request.
+    def stop(self):
+
+        self.cancel()
+
+        self._requests.put(None)
+
+        self.wait()  # Waiting for the thread to finish.
+
+    # Defining the run method, which serves the queued requests until stop is called.
     def run(self):
 
-        # Initializing an empty string to store the markdown response.
-        markdown = ''
+        while True:
 
-        # Iterating through the chunks of the AI response.
-        if (self.check_internet_connection()):
-            for chunk in self.ai.generateAnswer(self.input_text):
+            # Waiting for the next request.
+            item = self._requests.get()
 
-                # Appending the text of each chunk to the markdown string.
-                markdown += chunk.text
+            if item is None:  # Checking if the thread was asked to stop.
+                return
 
-            # Emitting the updated markdown as a progress signal.
+            if item is NEW_CHAT:  # Forgetting the earlier turns.
+                self.session.reset()
+                continue
 
-                self.progress.emit(markdown)
-        elif not self.check_internet_connection():
-            markdown = "No Internet Connection.Please Connect to Internet"
-            self.progress.emit(markdown)
-        else:
-            markdown = "Some Issue with Network , please check again"
-            self.progress.emit(markdown)
+            generation, request = item
+
+            with self._lock:
+
+                if generation != self._generation:  # Skipping a request superseded while it was queued.
+                    continue
+
+                self._answering = request
+
+            self.answer_started.emit(generation)  # Letting the chat area clear for the new answer.
+
+            self.answer(request, generation)
+
+            with self._lock:
+                self._answering = None
+
+            self.answer_finished.emit(generation)  # Letting the chat area render the end of the answer.
+
+    # Method to answer one request, emitting the markdown pieces as they stream in.
+    def answer(self, request, generation):
+
+        if request.units:  # Asking about each part of the file on its own.
+            self.answerParts(request, generation)
+            return
+
+        self.last_from_cache = False
+
+        # Looking up the library passages that best match the command, within the token budget.
+        passages = self.retrievePassages(request)
+
+        # Taking the earlier turns now; the call itself runs on a thread of the request manager.
+        history = self.session.history()
+
+        # Hashing the request: template, command, code, passages, model and the earlier turns, if any. A follow-up
+        # such as "shorter" only replays an answer given after the same conversation.
+        key = response_key(request.template, request.command, request.code, passages, self.ai.model_name,
+                           *history_parts(history))
+
+        # Building the new turn, leaving out the code when the earlier turns already hold it.
+        input_text = self.session.message(request.command, request.code, passages)
+
+        # Replaying a cached answer at once, even offline, unless the cache is bypassed.
+        if request.use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.last_from_cache = True
+                self.progress.emit(generation, cached)
+
+                # Keeping the replayed answer in the conversation, as if it had just been received.
+                self.session.record(request.command, request.code, input_text, cached)
+                return
+
+        # Starting the clock for the time to first token.
+        started = time.perf_counter()
+
+        # Starting the call, or joining an identical one already running.
+        subscription = self.manager.stream(key, lambda: GeminiStream(
+            self.ai.generateAnswer(input_text, history, request.template)))
+
+        with self._lock:
+
+            self._subscriptions = [subscription]
+
+            if generation != self._generation:  # Cancelling at once if superseded while the call was set up.
+                subscription.cancel()
+
+        pieces = []  # Collecting the answer to store it in the cache.
+
+        try:
+
+            # Iterating through the pieces of the AI response as the manager receives them.
+            for piece in subscription:
+
+                # Emitting the time to first token with the first piece.
+                if not pieces:
+                    self.first_token.emit((time.perf_counter() - started) * 1000)
+
+                pieces.append(piece)
+
+                # Emitting only the new text; the chat area appends it.
+                self.progress.emit(generation, piece)
+
+            # Recording that the API was reached.
+            self.connectivity.report(True)
+
+            # Storing the complete answer, also when the cache was bypassed, so it replaces an older one.
+            self.cache.put(key, ''.join(pieces))
+
+            # Adding the turn to the conversation; the oldest turns are summarized once it grows past its budget.
+            self.session.record(request.command, request.code, input_text, ''.join(pieces))
+
+        except RequestCancelled:
+
+            # Marking the answer as stopped; a cancelled turn is neither cached nor kept in the conversation.
+            self.progress.emit(generation, '\n\n*Stopped.*')
+
+        except Exception as e:
+
+            # Classifying the failure so the user gets a message that says what went wrong.
+            kind, message = classify_error(e)
+
+            if kind == 'offline':  # Remembering the connection is down, for the status label.
+                self.connectivity.report(False)
+
+            # Emitting the message after whatever part of the answer already arrived.
+            self.progress.emit(generation, '\n\n' + message if pieces else message)
+
+        finally:
+
+            with self._lock:
+                self._subscriptions = []
+
+
+    # Method to look up the library passages that best match the command, within the token budget.
+    def retrievePassages(self, request):
+
+        if request.retriever is None or not request.command.strip():
+            return ''
+
+        try:
+            return format_passages(request.retriever.retrieve(request.command))
+        except Exception as e:
+            print(e)
+            return ''
+
+    # Method to answer a request sent in parts: all parts are asked at once, the manager running a few
+    # calls at a time, and their answers are emitted in source order, each streaming in as it arrives.
+    def answerParts(self, request, generation):
+
+        self.last_from_cache = False
+
+        # Looking up the library passages once; every part is sent with them.
+        passages = self.retrievePassages(request)
+
+        # Taking the earlier turns now, so that every part is asked as a follow-up of the conversation.
+        history = self.session.history()
+
+        # Keying each part on its own, so that after an edit only the changed parts are asked again.
+        keys = [response_key(request.template, request.command, unit, passages, self.ai.model_name,
+                             *history_parts(history))
+                for unit in request.units]
+
+        # Taking the cached answers of the parts, unless the cache is bypassed.
+        cached = [self.cache.get(key) if request.use_cache else None for key in keys]
+
+        # Starting a call for every part without a cached answer; each part is sent with the passages and the command.
+        sources = []
+        for key, unit, answer in zip(keys, request.units, cached):
+            if answer is not None:
+                sources.append([answer])
+            else:
+                sources.append(self.manager.stream(key, lambda unit=unit: GeminiStream(
+                    self.ai.generateAnswer(passages + request.command + '\n' + unit, history, request.template))))
+
+        subscriptions = [source for source, answer in zip(sources, cached) if answer is None]
+
+        with self._lock:
+
+            self._subscriptions = subscriptions
+
+            if generation != self._generation:  # Cancelling at once if superseded while the calls were set up.
+                for subscription in subscriptions:
+                    subscription.cancel()
+
+        started = time.perf_counter()  # Starting the clock for the time to first token.
+
+        first = True  # Tracking whether the first piece was emitted.
+
+        answers = []  # Collecting the answers of the parts, to keep them in the conversation as one turn.
+
+        try:
+
+            for index, (key, source, answer) in enumerate(zip(keys, sources, cached)):
+
+                if index:  # Separating the answer of this part from the one before.
+                    self.progress.emit(generation, '\n\n')
+
+                pieces = []  # Collecting the answer of the part to store it in the cache.
+
+                try:
+
+                    # Emitting the pieces of the part; those received while earlier parts were shown come at once.
+                    for piece in source:
+
+                        if first:
+                            self.first_token.emit((time.perf_counter() - started) * 1000)
+                            first = False
+
+                        pieces.append(piece)
+
+                        self.progress.emit(generation, piece)
+
+                    if answer is None:
+
+                        self.connectivity.report(True)  # Recording that the API was reached.
+
+                        self.cache.put(key, ''.join(pieces))  # Storing the answer of the part.
+
+                    answers.append(''.join(pieces))
+
+                except RequestCancelled:
+                    raise
+
+                except Exception as e:
+
+                    # Classifying the failure of this part; the other parts go on.
+                    kind, message = classify_error(e)
+
+                    if kind == 'offline':  # Remembering the connection is down, for the status label.
+                        self.connectivity.report(False)
+
+                    self.progress.emit(generation, '\n\n' + message if pieces else message)
+
+            # Counting the answer as replayed when every part came from the cache.
+            self.last_from_cache = not subscriptions
+
+            # Adding the whole file and the joined answer as one turn, once every part was answered; the session
+            # cuts the turn down to its history budget.
+            if len(answers) == len(request.units):
+                self.session.record(request.command, request.code,
+                                    self.session.message(request.command, request.code, passages),
+                                    '\n\n'.join(answers))
+
+        except RequestCancelled:
+
+            # Marking the answer as stopped; the calls of the later parts were cancelled with it.
+            self.progress.emit(generation, '\n\n*Stopped.*')
+
+        finally:
+
+            with self._lock:
+                self._subscriptions = []
+
+
+# Defining a class GeminiStream: the text pieces of a streamed Gemini response, which can be closed from another thread.
+class GeminiStream:
+
+    # Constructor for GeminiStream, takes the streamed response.
+    def __init__(self, response):
+
+        self._response = response
+
+    # Iterating over the text of the chunks as they arrive.
+    def __iter__(self):
+
+        for chunk in self._response:
+            yield chunk.text
+
+    # Method to close the connection of the response, ending the iteration in the thread reading it.
+    def close(self):
+
+        # Cancelling the gRPC call or closing the HTTP response the chunks are read from.
+        cancel = getattr(getattr(self._response, '_iterator', None), 'cancel', None)
+
+        if cancel is not None:
+            cancel()
 
 
 class GeminiAi:  # Defining a class GeminiAi for interacting with the Google Gemini AI.
@@ -168,30 +542,68 @@ class GeminiAi:  # Defining a class GeminiAi for interacting with the Google Gem
         # Configuring the Gemini API with the provided API key.
         gemini.configure(api_key=api_key)
 
+        self.model_name = ai_model  # Keeping the model name; it is part of the response cache key.
+
         # Creating a GenerativeModel object with the specified model.
         self._model = gemini.GenerativeModel(ai_model)
 
-        # Starting a chat session with the model.
-        self._chat = self._model.start_chat()
+        # Keeping one model per prompt template, with the template as its system instruction, and when
+        # each expires; built once, so the fixed instructions are not part of every message sent.
+        self._models = {'': (self._model, float('inf'))}
 
-    # Method to generate an answer from the AI model, takes input string as argument.
+        # Guarding the models, which the request manager asks for from several threads at once; held while a
+        # model is built, so that the parts of one request share a single context cache on the server.
+        self._models_lock = threading.Lock()
 
+    # Method to get the model answering with the given instructions, building it on first use.
+    def modelFor(self, system_instruction: str):
 
-    def generateAnswer(self, input: str):
+        with self._models_lock:
+            return self._modelFor(system_instruction)
 
-        # Generating content from the model with streaming enabled.
-        response = self._model.generate_content(input, stream=True)
+    # Method to look up or build the model for the instructions; called with the models lock held.
+    def _modelFor(self, system_instruction: str):
 
-        return response  # Returning the streamed response.
+        model, expires = self._models.get(system_instruction, (None, 0))
 
-    # Method to load a prompt from a file, takes file name as argument.
-    def loadPrompt(self, file_name: str):
+        if time.time() < expires:  # Reusing the model while its cached instructions are alive.
+            return model
 
-        with open(resource_path(file_name)) as file:  # Opening the file in read mode.
+        model, expires = None, float('inf')
 
-            prompt_enhance = file.read()  # Reading the content of the file.
+        # Uploading long instructions once as a Gemini context cache, which the API refuses below its minimum size.
+        if estimate_tokens(system_instruction) >= CONTEXT_CACHE_MIN_TOKENS:
+            try:
+                cached = caching.CachedContent.create(self.model_name, system_instruction=system_instruction,
+                                                      ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL))
+                model = gemini.GenerativeModel.from_cached_content(cached)
+
+                # Rebuilding a little before the cache expires on the server.
+                expires = time.time() + CONTEXT_CACHE_TTL - 60
+            except Exception as e:
+                print(e)
+
+        # Otherwise sending the instructions as the system instruction of a model of their own.
+        if model is None:
+            model = gemini.GenerativeModel(self.model_name, system_instruction=system_instruction)
+
+        self._models[system_instruction] = (model, expires)
+
+        return model
+
+    # Method to generate an answer from the AI model, takes the new turn, the earlier turns and the instructions.
+    def generateAnswer(self, input: str, history=(), system_instruction: str = ''):
 
-        return prompt_enhance  # Returning the prompt content.
+        # Starting a chat with the model for the instructions, holding the bounded history kept by the ChatSession;
+        # one chat per call, since the request manager may run several calls at once.
+        chat = self.modelFor(system_instruction).start_chat(history=list(history))
+
+        # Sending the new turn with streaming enabled. Without the client's own retries an unreachable
+        # API fails at once instead of being retried for minutes; the timeout bounds a stalled answer.
+        response = chat.send_message(input, stream=True,
+                                      request_options={'timeout': AI_REQUEST_TIMEOUT, 'retry': None})
+
+        return response  # Returning the streamed response.
 
 
 # Defining a class UI that inherits from QWidget to represent the main user interface.
@@ -261,13 +673,11 @@ class EditorUI(QWidget):
         # Creating a combo box for selecting AI commands.
         self._prompt_command = QComboBox()
 
-        self._prompt_command.addItem('None')  # Adding 'None' as an item.
-
-        self._prompt_command.addItem('explain')  # Adding 'explain' as an item.
+        # Loading every prompt template once; an edited template file is read again on its next use.
+        self._prompts = PromptRegistry(resource_path('.prompt_train'))
 
-        self._prompt_command.addItem('fixit')  # Adding 'fixit' as an item.
-
-        self._prompt_command.addItem('comment')  # Adding 'comment' as an item.
+        # Adding the prompt commands as items.
+        self._prompt_command.addItems(self._prompts.names())
 
         self._prompt = QLineEdit()  # Creating a line edit for user input.
 
@@ -282,14 +692,61 @@ class EditorUI(QWidget):
         # Connecting the clicked signal to the runThread method.
         self._send_button.clicked.connect(self.runThread)
 
-        # Creating a tree widget to display files.
-        self._file_tree = QTreeWidget()
+        self._stop_button = QPushButton('Stop')  # Creating a Stop button.
 
         # Setting the object name for styling purposes.
-        self._file_tree.setObjectName('tree_view')
+        self._stop_button.setObjectName('send')
+
+        # Connecting the clicked signal to the stopAnswer method.
+        self._stop_button.clicked.connect(self.stopAnswer)
+
+        self._new_chat_button = QPushButton('New chat')  # Creating a New chat button.
+
+        # Setting the object name for styling purposes.
+        self._new_chat_button.setObjectName('send')
+
+        # Connecting the clicked signal to the newChat method.
+        self._new_chat_button.clicked.connect(self.newChat)
+
+        # Creating a check box to add relevant passages from the library PDFs to the prompt.
+        self._use_library = QCheckBox('Library')
+
+        # Setting the tool tip explaining the check box.
+        self._use_library.setToolTip('Add the most relevant passages from the Library PDFs to the prompt')
+
+        # Creating the local passage index over the PDFs indexed by the library.
+        self._retriever = Retriever()
+
+        # Creating a check box to run explain or comment over the whole file, one part at a time.
+        self._split_file = QCheckBox('Parts')
+
+        # Setting the tool tip explaining the check box.
+        self._split_file.setToolTip('Explain or comment the whole file, sending its functions and classes '
+                                    'as parallel requests')
+
+        # Creating a check box to ask Gemini again instead of replaying a cached answer.
+        self._bypass_cache = QCheckBox('Fresh')
+
+        # Setting the tool tip explaining the check box.
+        self._bypass_cache.setToolTip('Ask Gemini again instead of replaying a cached answer')
+
+        # Creating a label showing which part of the code the last request sent.
+        self._context_label = QLabel()
+
+        # Setting the object name for styling purposes.
+        self._context_label.setObjectName('aiStatus')
+
+        # Creating a label showing the response cache hit rate.
+        self._status_label = QLabel()
+
+        # Setting the object name for styling purposes.
+        self._status_label.setObjectName('aiStatus')
+
+        # Creating a lazy tree widget to display files; folders are listed when expanded.
+        self._file_tree = LazyFileTree(EDITOR_EXTENSIONS)
 
-        # Hiding the header of the tree widget.
-        self._file_tree.setHeaderHidden(True)
+        # Setting the object name for styling purposes.
+        self._file_tree.setObjectName('tree_view')
 
         # Connecting the itemClicked signal to the loadTreeFile method.
         self._file_tree.itemClicked.connect(self.ide.loadTreeFile)
@@ -315,9 +772,29 @@ class EditorUI(QWidget):
         # Adding the line edit to the prompt layout.
         self.prompt_layout.addWidget(self._prompt)
 
+        # Adding the library check box to the prompt layout.
+        self.prompt_layout.addWidget(self._use_library)
+
+        # Adding the file parts check box to the prompt layout.
+        self.prompt_layout.addWidget(self._split_file)
+
+        # Adding the cache bypass check box to the prompt layout.
+        self.prompt_layout.addWidget(self._bypass_cache)
+
         # Adding the send button to the prompt layout.
         self.prompt_layout.addWidget(self._send_button)
 
+        # Adding the stop button to the prompt layout.
+        self.prompt_layout.addWidget(self._stop_button)
+
+        # Adding the new chat button to the prompt layout.
+        self.prompt_layout.addWidget(self._new_chat_button)
+
+        # Adding the context and status labels to the prompt layout.
+        self.prompt_layout.addWidget(self._context_label)
+
+        self.prompt_layout.addWidget(self._status_label)
+
         # Creating a vertical layout for the right side.
         self.right_side_layout = QVBoxLayout()
 
@@ -333,6 +810,34 @@ class EditorUI(QWidget):
         # Setting the chat area to read-only.
         self._chat_area.setReadOnly(True)
 
+        # Creating the stream that renders answers into the chat area as they arrive.
+        self._chat_stream = MarkdownStream(self._chat_area)
+
+        # Creating the AI worker that serves every Send with the same GeminiAi.
+        self.ai_work = GeminiWorker(self._ai)
+
+        # Showing only the answers of the current conversation; those of older generations belong to the previous one.
+        self._chat_generation = 0
+
+        # Connecting the answer signals to the chat area stream.
+        self.ai_work.answer_started.connect(self.startAnswer)
+
+        self.ai_work.progress.connect(self.updateChatArea)
+
+        # Rendering the end of the answer and refreshing the cache status once an answer is complete.
+        self.ai_work.answer_finished.connect(self.finishAnswer)
+
+        # Showing the time to first token of the last answer on the Send button.
+        self.ai_work.first_token.connect(self.showFirstTokenTime)
+
+        self.ai_work.start()  # Starting the AI thread.
+
+        self.updateStatus()  # Showing the initial cache status.
+
+        # Stopping the AI worker when the application quits.
+        if QApplication.instance() is not None:
+            QApplication.instance().aboutToQuit.connect(self.ai_work.stop)
+
         # Creating a dock widget for the chat area.
         self.dock_layout = QDockWidget()
 
@@ -397,60 +902,35 @@ class EditorUI(QWidget):
         # Opening a file using the openFile method of the Editor class.
         self.ide.openFile()
 
-        # Populating the file tree with the files in the directory of the opened file.
-        self.populateTree(os.path.dirname(self.ide.file_path))
+        # Showing the directory of the opened file in the file tree.
+        self.showFolderOf(self.ide.file_path)
 
-    # Recursive method to add items to the file tree.
     def createAndShowFilesFolder(self):
         #creating a file using the newFile method of the Editor class
         self.ide.newFile()
 
-        #Populating the file tree with the files in the directory of the opened file.
-        self.populateTree(os.path.dirname(self.ide.file_path))
-
-    def add_tree_items(self, parent_item, path):
-
-        extension = ['.py', '.c', '.cpp', '.txt',  # List of supported file extensions.
-
-                     '.md', '.html', '.css', '.js']
-
-        # Iterating through the items in the given path.
-        for item_name in os.listdir(path):
-
-            # Creating the full path of the item.
-            item_path = os.path.join(path, item_name)
-
-            # Checking if the item is a directory.
-            if os.path.isdir(item_path):
-
-                # Creating a tree item for the directory.
-                tree_item = QTreeWidgetItem(parent_item)
-
-                # Setting the text of the tree item to the directory name.
-                tree_item.setText(0, item_name)
+        # Showing the directory of the new file in the file tree.
+        self.showFolderOf(self.ide.file_path)
 
-                # Setting the data of the tree item to the directory path.
-                tree_item.setData(0, Qt.UserRole, item_path)
+    # Method to show the directory of a file without rebuilding a tree that already contains it.
+    def showFolderOf(self, file_path):
 
-                # Recursively calling the method for subdirectories.
-                self.add_tree_items(tree_item, item_path)
+        if not file_path:  # Checking if a file was chosen.
+            return
 
-                # Setting the directory to be initially collapsed.
-                tree_item.setExpanded(False)
+        folder = os.path.abspath(os.path.dirname(file_path))
+        root = self._file_tree.root_path
 
-            else:  # If the item is not a directory.
+        # Checking if the folder is already inside the tree; new files show up through its watcher.
+        if root and is_inside(folder, root):
 
-                # Checking if the item has a supported extension.
-                if any(item_name.endswith(ext) for ext in extension):
+            # Keeping tree paths relative to the tree root.
+            self.ide.dir_path = root
 
-                    # Creating a tree item for the file.
-                    tree_item = QTreeWidgetItem(parent_item)
-
-                    # Setting the text of the tree item to the file name.
-                    tree_item.setText(0, item_name)
+        else:
 
-                    # Setting the data of the tree item to the file path.
-                    tree_item.setData(0, Qt.UserRole, item_path)
+            # Populating the file tree with the files in the directory of the file.
+            self.populateTree(folder)
 
     def showFiles(self):  # Method to show a file dialog to select a folder.
 
@@ -463,60 +943,54 @@ class EditorUI(QWidget):
     # Method to populate the file tree with the files in a given folder.
     def populateTree(self, folder):
 
-        self._file_tree.clear()  # Clearing the file tree.
-
         if folder:  # Checking if a folder was selected.
 
             # Setting the directory path in the Editor class.
             self.ide.dir_path = folder
 
-            # Creating a root item for the folder.
-            root_item = QTreeWidgetItem(self._file_tree)
-
-            # Setting the text of the root item to the folder name.
-            root_item.setText(0, os.path.basename(folder))
-
-            # Setting the data of the root item to the folder path.
-            root_item.setData(0, Qt.UserRole, folder)
-
-            # Setting the root item to be initially expanded.
-            root_item.setExpanded(True)
-
-            # Calling the add_tree_items method to add items to the tree.
-            self.add_tree_items(root_item, folder)
+        # Replacing the root of the file tree; its entries are listed on a worker thread.
+        self._file_tree.setRoot(folder)
 
     def collectInput(self):  # Method to collect user input for the AI.
 
-        if self._prompt_command.currentIndex() == 0:  # none
+        # Getting the template of the selected prompt command from the registry.
+        input_prompt = self._prompts.template(self._prompt_command.currentText())
+
+        # Getting the text from the prompt line edit.
+        input_command = self._prompt.text()
 
-            # Setting input_prompt to an empty string if 'None' is selected.
-            input_prompt = ''
+        units = None  # Keeping the parts of the file when it is sent in parts.
 
-        elif self._prompt_command.currentIndex() == 1:  # explain
+        if self._split_file.isChecked() and self._prompt_command.currentText() in SPLIT_COMMANDS:
 
-            # Loading the 'explain' prompt from a file.
-            input_prompt = self._ai.loadPrompt('.prompt_train/explain.txt')
+            # Splitting the whole file at its functions and classes.
+            input_code = self.ide.text()
 
-        elif self._prompt_command.currentIndex() == 2:  # fixt
+            units = tuple(split_units(input_code, self.ide.file_path))
 
-            # Loading the 'fixt' prompt from a file.
-            input_prompt = self._ai.loadPrompt('.prompt_train/fixt.txt')
+            # Showing how many parts are sent and their estimated size.
+            self._context_label.setText(f'Sending the file in {len(units)} parts, '
+                                        f'~{estimate_tokens(input_code)} tokens')
 
-        elif self._prompt_command.currentIndex() == 3:  # comment
+        else:
 
-            input_prompt = self._ai.loadPrompt('.prompt_train/comment.txt')
+            # Getting the selection, or the function or class around the cursor with what it uses, within the budget.
+            context = build_context(self.ide.text(), self.ide.file_path, self.ide.selectedText(),
+                                    self.ide.getCursorPosition()[0])
 
-        # Getting the text from the prompt line edit.
-        input_command = self._prompt.text()
+            input_code = context.text
 
-        input_code = self.ide.text()  # Getting the code from the code editor.
+            # Showing what is being sent and its estimated size.
+            self._context_label.setText(f'Sending {context.description}, ~{context.tokens} tokens')
 
         self._prompt.clear()  # Clearing the prompt line edit.
 
-        # Combining the prompts, command, and code into a single string.
-        final_input = input_prompt + input_command + '\n' + input_code
+        # Passing the retriever only when library passages are wanted.
+        retriever = self._retriever if self._use_library.isChecked() else None
 
-        return final_input  # Returning the combined input string.
+        # Keeping the parts apart; the worker joins them and uses them as the cache key.
+        return AiRequest(input_prompt, input_command, input_code, retriever,
+                         not self._bypass_cache.isChecked(), units)
 
     def runThread(self):  # Method to run the AI thread.
 
@@ -524,21 +998,62 @@ class EditorUI(QWidget):
 
         self.dock_layout.repaint()  # Repainting the dock widget.
 
-        # Creating an instance of the GeminiThreat class.
-        self.ai_work = GeminiThreat(self._chat_area, self.collectInput())
+        # Queuing the request on the long-lived AI worker, superseding the answer in progress.
+        self.ai_work.submit(self.collectInput())
 
-        # Connecting the progress signal to the updateChatArea method.
-        self.ai_work.progress.connect(self.updateChatArea)
+    def stopAnswer(self):  # Method to stop the answer being streamed.
 
-        self.ai_work.start()  # Starting the AI thread.
+        self.ai_work.cancel()  # Ending the stream at once and dropping the queued requests.
+
+    def newChat(self):  # Method to start a new conversation with the AI.
+
+        # Dropping the earlier turns, and ignoring what the cancelled answer still sends.
+        self._chat_generation = self.ai_work.newChat()
+
+        self._chat_stream.begin()  # Clearing the chat area.
+
+    # Method to clear the chat area for a new answer of the current conversation.
+    def startAnswer(self, generation: int):
+
+        if generation >= self._chat_generation:
+            self._chat_stream.begin()
+
+    # Method to render the end of an answer of the current conversation.
+    def finishAnswer(self, generation: int):
+
+        if generation >= self._chat_generation:
+            self._chat_stream.finish()
+
+        self.updateStatus()
+
+    # Method to show the response cache hit rate, and whether the last answer came from the cache.
+    def updateStatus(self):
+
+        stats = self.ai_work.cache.stats()
+
+        lookups = stats['hits'] + stats['misses']
+
+        source = 'cached answer · ' if self.ai_work.last_from_cache else ''
+
+        # Showing when the Gemini API looks unreachable; the next request is still sent.
+        connection = ' · offline?' if self.ai_work.connectivity.is_online() is False else ''
+
+        self._status_label.setText(f"{source}cache {stats['hits']}/{lookups} hits ({stats['hit_rate']:.0%}){connection}")
+
+    # Method to show how long the last answer took to start.
+    def showFirstTokenTime(self, milliseconds: float):
+
+        self._send_button.setToolTip(f'Last answer started after {milliseconds:.0f} ms')
 
-    # Method to update the chat area with the AI response.
-    def updateChatArea(self, text: str):
+    # Method to update the chat area with a new piece of the AI response.
+    def updateChatArea(self, generation: int, text: str):
 
-        # Setting the markdown text in the chat area.
-            self._chat_area.setMarkdown(text)
+        # Skipping the pieces of an answer from the previous conversation.
+        if generation < self._chat_generation:
+            return
 
-            self._chat_area.repaint()  # Repainting the chat area.
+        # Appending the text; the stream renders it at the next display frame.
+        self._chat_stream.append(text)
 
     def execute_cmd(self, cmd):
         if platform.system() == "Windows":
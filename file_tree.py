@@ -0,0 +1,236 @@
+import os
+import queue
+
+from PyQt5.QtCore import Qt, QThread, QTimer, QFileSystemWatcher, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QTreeWidget, QTreeWidgetItem
+
+from app_paths import normalize_path
+
+
+# Entries sent to the GUI thread per batch while a directory is being listed.
+LISTING_BATCH = 200
+
+# Quiet time after a change notification before the changed directories are re-listed.
+WATCH_DEBOUNCE_MS = 200
+# Interval at which directories the watcher could not take are checked for changes.
+POLL_INTERVAL_MS = 2000
+
+# Item data role holding whether an item is a directory; Qt.UserRole holds its path.
+IS_DIR_ROLE = Qt.UserRole + 1
+
+
+class DirectoryLister(QThread):
+    """Lists directories with os.scandir on a worker thread, streaming the entries in batches."""
+    listed = pyqtSignal(int, str, list, bool)  # Emit request id, directory, [(name, path, is_dir)], done
+
+    def __init__(self, extensions=None):
+        super().__init__()
+        self.extensions = tuple(extensions) if extensions else None
+        self._requests = queue.Queue()
+
+    def request(self, request_id, directory):
+        self._requests.put((request_id, directory))
+
+    def stop(self):
+        self._requests.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            request_id, directory = request
+            batch = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            continue
+                        # Filter here so the GUI thread only sees the entries it shows
+                        if not is_dir and self.extensions and not entry.name.lower().endswith(self.extensions):
+                            continue
+                        batch.append((entry.name, entry.path, is_dir))
+                        if len(batch) >= LISTING_BATCH:
+                            self.listed.emit(request_id, directory, batch, False)
+                            batch = []
+            except OSError as e:
+                print(e)
+            self.listed.emit(request_id, directory, batch, True)
+
+
+class LazyFileTree(QTreeWidget):
+    """File tree that lists a directory only when it is first expanded.
+
+    Listing happens on a DirectoryLister thread; only files ending in one of
+    extensions are shown, directories always are. Listed directories are
+    watched (inotify on Linux, polling where the watcher fails) and re-listed
+    after a burst of changes, adding and removing only the entries that changed.
+    """
+    itemsAdded = pyqtSignal(list)  # Emit the items created from one batch
+    directoryRefreshed = pyqtSignal(str)  # Emit a directory re-listed after it changed
+
+    def __init__(self, extensions=None, parent=None):
+        super().__init__(parent)
+        self.setHeaderHidden(True)
+        self.root_path = None
+        self._items = {}
+        self._loaded = set()
+        # Listings in flight by request id: (directory, paths seen, or None for a first listing)
+        self._listings = {}
+        self._listing_of = {}  # Request id of the listing in flight per directory
+        self._next_request = 0
+        self._lister = DirectoryLister(extensions)
+        self._lister.listed.connect(self._addEntries)
+        self._lister.start()
+        self.itemExpanded.connect(self._listItem)
+
+        # Change notifications are collected and handled together once they stop
+        self._dirty = set()
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._markDirty)
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(WATCH_DEBOUNCE_MS)
+        self._refresh_timer.timeout.connect(self._refreshDirty)
+        self._polled = {}
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(POLL_INTERVAL_MS)
+        self._poll_timer.timeout.connect(self._pollDirectories)
+        if QApplication.instance() is not None:
+            QApplication.instance().aboutToQuit.connect(self._lister.stop)
+
+    def setRoot(self, folder):
+        # Batches of a previous root still in flight are dropped, their request ids being forgotten
+        self.clear()
+        self._items = {}
+        self._loaded = set()
+        self._listings = {}
+        self._listing_of = {}
+        self._unwatch(self._watcher.directories() + list(self._polled))
+        self._dirty = set()
+        self.root_path = folder
+        if not folder:
+            return None
+        root_item = self._createItem(self, os.path.basename(folder), folder, True)
+        root_item.setExpanded(True)
+        return root_item
+
+    def itemForPath(self, path):
+        # Items are indexed by normalized path, so any spelling of a path finds its item
+        return self._items.get(normalize_path(path))
+
+    def removePath(self, path):
+        item = self._items.pop(normalize_path(path), None)
+        if item is None:
+            return
+        # Forget everything listed below a removed directory as well
+        key_prefix = os.path.join(normalize_path(path), "")
+        for key in [key for key in self._items if key.startswith(key_prefix)]:
+            del self._items[key]
+        path = item.data(0, Qt.UserRole)
+        prefix = os.path.join(path, "")
+        self._unwatch([p for p in self._loaded if p == path or p.startswith(prefix)])
+        self._loaded = {p for p in self._loaded if p != path and not p.startswith(prefix)}
+        (item.parent() or self.invisibleRootItem()).removeChild(item)
+
+    def _createItem(self, parent, name, path, is_dir):
+        item = QTreeWidgetItem(parent)
+        item.setText(0, name)
+        item.setData(0, Qt.UserRole, path)
+        item.setData(0, IS_DIR_ROLE, is_dir)
+        if is_dir:
+            # Show an expand arrow before the directory has been listed
+            item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+        self._items[normalize_path(path)] = item
+        return item
+
+    def _listItem(self, item):
+        path = item.data(0, Qt.UserRole)
+        if item.data(0, IS_DIR_ROLE) and path not in self._loaded:
+            self._loaded.add(path)
+            self._watch(path)
+            self._requestListing(path, None)
+
+    def _requestListing(self, directory, seen):
+        self._next_request += 1
+        self._listings[self._next_request] = (directory, seen)
+        self._listing_of[directory] = self._next_request
+        self._lister.request(self._next_request, directory)
+
+    def _watch(self, path):
+        # addPaths returns the paths it could not watch, e.g. past the inotify limit
+        for failed in self._watcher.addPaths([path]):
+            try:
+                self._polled[failed] = os.stat(failed).st_mtime
+            except OSError:
+                continue
+            self._poll_timer.start()
+
+    def _unwatch(self, paths):
+        watched = set(self._watcher.directories())
+        stale = [path for path in paths if path in watched]
+        if stale:
+            self._watcher.removePaths(stale)
+        for path in paths:
+            self._polled.pop(path, None)
+        if not self._polled:
+            self._poll_timer.stop()
+
+    def _pollDirectories(self):
+        for path, mtime in list(self._polled.items()):
+            try:
+                current = os.stat(path).st_mtime
+            except OSError:
+                current = None
+            if current != mtime:
+                self._polled[path] = current
+                self._markDirty(path)
+
+    def _markDirty(self, path):
+        self._dirty.add(path)
+        self._refresh_timer.start()
+
+    def _refreshDirty(self):
+        # A directory with a listing still running, its first one included, stays
+        # dirty; it is listed again once that listing is done
+        busy = set()
+        for path in self._dirty:
+            if path in self._listing_of:
+                busy.add(path)
+            elif path in self._loaded:
+                # Paths seen by the new listing; the other children are removed when it is done
+                self._requestListing(path, set())
+        self._dirty = busy
+
+    def _addEntries(self, request_id, directory, entries, done):
+        listing = self._listings.get(request_id)
+        if listing is None:
+            # A listing for a previous root
+            return
+        seen = listing[1]
+        if done:
+            del self._listings[request_id]
+            del self._listing_of[directory]
+            if self._dirty:
+                self._refresh_timer.start()
+        parent = self.itemForPath(directory)
+        if parent is None:
+            # The directory was removed while it was being listed
+            return
+        items = [self._createItem(parent, name, path, is_dir)
+                 for name, path, is_dir in entries if self.itemForPath(path) is None]
+        if seen is not None:
+            seen.update(path for _, path, _ in entries)
+        if done:
+            parent.setChildIndicatorPolicy(QTreeWidgetItem.DontShowIndicatorWhenChildless)
+            if seen is not None:
+                for child in [parent.child(i) for i in range(parent.childCount())]:
+                    if child.data(0, Qt.UserRole) not in seen:
+                        self.removePath(child.data(0, Qt.UserRole))
+        if items:
+            self.itemsAdded.emit(items)
+        if done and seen is not None:
+            self.directoryRefreshed.emit(directory)
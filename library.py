@@ -1,61 +1,597 @@
 from PyQt5.QtCore import (Qt,
     QThread,
+    QTimer,
+    QRect,
+    QRectF,
+    QSize,
     pyqtSignal,
     pyqtSlot,
     QPoint)
-from PyQt5.QtWidgets import (QWidget,
+from PyQt5.QtWidgets import (QApplication,
+    QWidget,
     QPushButton,
-    QTreeWidget,
-    QTreeWidgetItem,
     QVBoxLayout,
     QHBoxLayout,
     QFileDialog,
     QLabel,
+    QLineEdit,
+    QListWidget,
+    QListWidgetItem,
     QScrollArea)
 
-from PyQt5.QtGui import (QPixmap, QImage)
+from PyQt5.QtGui import (QPixmap, QImage, QPainter, QColor, QIcon)
+from PyQt5 import sip
 import fitz  # PyMuPDF
-from multiprocessing import Pool,cpu_count
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from collections import namedtuple
 from functools import partial
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import atexit
+import heapq
 import math
 import os
 
+from app_paths import WORKER_PROCESSES
+from catalog import LibraryCatalog
+from search_index import SearchIndex
+from retrieval import Retriever
+from file_tree import LazyFileTree, IS_DIR_ROLE
 
-class PageLoaderThread(QThread):
-    page_loaded = pyqtSignal(int, QPixmap)  # Emit page number and pixmap
 
-    def __init__(self, file_path, scale_factor=1.0):
+# Extra distance (in pixels) above and below the viewport whose pages are kept rendered.
+RENDER_MARGIN = 600
+# Gap between two pages in the viewer.
+PAGE_SPACING = 10
+# Total size of the rendered pages kept by page_cache.
+PAGE_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class PageCache:
+    """Process-wide LRU cache of rendered page images, bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes=PAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(file_path, mtime, page_number, scale_factor, tile=None, grayscale=False):
+        # Zoom steps accumulate float error (1.2000000000000002), so round the scale
+        return (os.path.abspath(file_path), mtime, page_number, round(scale_factor, 3), tile, grayscale)
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def __contains__(self, key):
+        # Membership test that leaves the LRU order and the counters untouched
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, image):
+        size = image.sizeInBytes()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.sizeInBytes()
+            self._entries[key] = image
+            self._bytes += size
+            self._evict()
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        # Called with the lock held
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.sizeInBytes()
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+page_cache = PageCache()
+
+# Render job priorities; lower values run first.
+PRIORITY_VISIBLE = 0
+PRIORITY_PREFETCH = 1
+# Pages prefetched in scroll direction, and against it, once the viewer is idle.
+PREFETCH_AHEAD = 4
+PREFETCH_BEHIND = 1
+# Time without scrolling after which the viewer counts as idle.
+PREFETCH_IDLE_MS = 300
+# Scale change per zoom click, and how long the zoom level must stay put before
+# the rescaled previews are replaced with sharp renders.
+ZOOM_STEP = 0.2
+ZOOM_SETTLE_MS = 250
+# Pages larger than this many device pixels are rendered as TILE_SIZE square tiles,
+# of which only those near the viewport are rasterized.
+TILE_THRESHOLD = 4_000_000
+TILE_SIZE = 512
+TILE_MARGIN = 256
+# Default ceiling for the pixmaps a PDFView holds plus page_cache; past it off-screen
+# pages are downsampled by PREVIEW_FACTOR and then evicted.
+VIEWER_MEMORY_LIMIT = 192 * 1024 * 1024
+PREVIEW_FACTOR = 0.25
+# Part of the ceiling page_cache may use, normally and in low-memory mode.
+PAGE_CACHE_SHARE = 0.5
+LOW_MEMORY_CACHE_SHARE = 0.125
+# Once over the ceiling, pages around the viewport are rendered again only after the
+# held pixmaps fall below this part of their budget.
+MEMORY_RESUME_FRACTION = 0.75
+
+# Number of render worker processes.
+RENDER_WORKERS = WORKER_PROCESSES
+# Documents each process (the GUI and every render worker) keeps open.
+DOCUMENT_POOL_SIZE = 4
+
+# Size of each shared buffer a worker writes samples into. Larger pages are tiled,
+# so one job never exceeds TILE_THRESHOLD pixels of at most 4 bytes.
+SAMPLE_BUFFER_BYTES = TILE_THRESHOLD * 4
+
+# QImage format for fitz pixmaps, keyed by (components per pixel, alpha)
+IMAGE_FORMATS = {
+    (1, False): QImage.Format_Grayscale8,
+    (3, False): QImage.Format_RGB888,
+    (4, True): QImage.Format_RGBA8888,
+}
+
+# What a render worker hands back: either the name of the shared buffer holding the
+# samples, or the samples themselves when no buffer was given, and the sample bytes
+# the worker copied to get them there.
+RenderedSamples = namedtuple("RenderedSamples",
+                             "job width height stride components alpha buffer samples copied")
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+# Sample buffers attached by the current render worker process.
+_worker_buffers = {}
+
+
+class DocumentPool:
+    """Small LRU pool of open fitz documents keyed by path and mtime.
+
+    Reopening a recent document skips parsing its xref and page tree. Handles are
+    closed when they fall out of the pool or when their file changes on disk.
+    fitz documents are not thread-safe, so use them inside open().
+    """
+
+    def __init__(self, size=DOCUMENT_POOL_SIZE):
+        self.size = size
+        self._documents = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, file_path, mtime=None):
+        file_path = os.path.abspath(file_path)
+        if mtime is None:
+            mtime = os.path.getmtime(file_path)
+        key = (file_path, mtime)
+        with self._lock:
+            doc = self._documents.get(key)
+            if doc is not None:
+                self._documents.move_to_end(key)
+                return doc
+
+            # The file changed since the stale handle was opened
+            for stale in [k for k in self._documents if k[0] == file_path]:
+                self._documents.pop(stale).close()
+
+            doc = fitz.open(file_path)
+            self._documents[key] = doc
+            while len(self._documents) > self.size:
+                _, old = self._documents.popitem(last=False)
+                old.close()
+            return doc
+
+    @contextmanager
+    def open(self, file_path, mtime=None):
+        with self._lock:
+            yield self.get(file_path, mtime)
+
+    def close(self):
+        with self._lock:
+            for doc in self._documents.values():
+                doc.close()
+            self._documents.clear()
+
+
+document_pool = DocumentPool()
+
+
+class _PageEdges:
+    """Read-only sequence of one edge of each page's geometry, for bisect on Python < 3.10."""
+
+    def __init__(self, pages, edge):
+        self._pages = pages
+        self._edge = edge
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __getitem__(self, index):
+        return self._edge(self._pages[index].geometry())
+
+
+def render_pool():
+    """Return the shared pool of render worker processes, starting it on first use."""
+    global _render_pool
+    # Called from the GUI thread and from the RenderScheduler thread
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn instead of fork: forking a process that runs Qt threads is unsafe
+            _render_pool = get_context("spawn").Pool(RENDER_WORKERS)
+            atexit.register(_render_pool.terminate)
+        return _render_pool
+
+
+def tile_clip(tile, scale_factor):
+    """Return the page-space rectangle covered by a (column, row) tile at scale_factor."""
+    column, row = tile
+    size = TILE_SIZE / scale_factor
+    return fitz.Rect(column * size, row * size, (column + 1) * size, (row + 1) * size)
+
+
+def _worker_buffer(name):
+    buffer = _worker_buffers.get(name)
+    if buffer is None:
+        # Workers share the resource tracker of the process that created the block,
+        # so attaching here does not make the block outlive (or die with) the worker
+        buffer = SharedMemory(name=name)
+        _worker_buffers[name] = buffer
+    return buffer
+
+
+def _render_page_samples(file_path, mtime, scale_factor, grayscale, task):
+    # Runs in a render worker. A task is (job, buffer name), a job is (page number,
+    # tile) with tile None standing for the whole page. The samples are copied once,
+    # straight from the fitz pixmap into the shared buffer, and only metadata is
+    # pickled back; without a buffer (or if it is too small) they travel inline.
+    job, buffer_name = task
+    page_number, tile = job
+    page = document_pool.get(file_path, mtime)[page_number]
+    matrix = fitz.Matrix(scale_factor, scale_factor)
+    # Grayscale takes one byte per pixel instead of three
+    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+    if tile is None:
+        pix = page.get_pixmap(matrix=matrix, colorspace=colorspace, alpha=False)
+    else:
+        pix = page.get_pixmap(matrix=matrix, colorspace=colorspace, alpha=False,
+                              clip=tile_clip(tile, scale_factor) & page.rect)
+
+    size = pix.stride * pix.height
+    if buffer_name is not None and size <= SAMPLE_BUFFER_BYTES:
+        _worker_buffer(buffer_name).buf[:size] = pix.samples_mv
+        return RenderedSamples(job, pix.width, pix.height, pix.stride, pix.n, bool(pix.alpha),
+                               buffer_name, None, size)
+    samples = pix.samples
+    # Once out of the fitz pixmap into bytes, once more when the pool pickles the result
+    return RenderedSamples(job, pix.width, pix.height, pix.stride, pix.n, bool(pix.alpha),
+                           None, samples, 2 * len(samples))
+
+
+def samples_to_image(result, buffer=None):
+    """Build a QImage that owns its pixels from a RenderedSamples result.
+
+    This is the only copy on the receiving side: the QImage is created over the
+    shared buffer (or the inline samples) and detached with copy().
+    """
+    image_format = IMAGE_FORMATS[(result.components, result.alpha)]
+    if result.samples is not None:
+        return QImage(result.samples, result.width, result.height, result.stride, image_format).copy()
+    pixels = sip.voidptr(buffer.buf)
+    image = QImage(pixels, result.width, result.height, result.stride, image_format).copy()
+    # Release the export so the shared buffer can be reused and closed
+    del pixels
+    return image
+
+
+class RenderScheduler(QThread):
+    """Long-lived render thread that feeds the worker pool from a priority queue.
+
+    A job is a (page number, tile) pair, tile being None for a whole page. Jobs
+    belong to the generation they were submitted in; setDocument() starts a new
+    generation, dropping queued jobs and any result of an older one.
+    """
+    page_loaded = pyqtSignal(int, object, QImage)  # Emit generation, job and image
+
+    def __init__(self):
         super().__init__()
-        self.file_path = file_path
-        self.scale_factor = scale_factor
+        self._condition = threading.Condition()
+        # Heap of (priority, sequence, job); entries no longer in _queued are stale
+        self._queue = []
+        self._queued = {}
+        self._in_flight = set()
+        self._sequence = 0
+        self._stopping = False
+        self.generation = 0
+        self.file_path = None
+        self.mtime = None
+        self.scale_factor = 1.0
+        self.grayscale = False
+        # One shared sample buffer per job of a batch, reused for every batch
+        self._buffers = []
+        # Sample bytes copied between fitz and the QImage handed to the GUI thread, counted
+        # at each copy the path of a result makes
+        self.bytes_copied = 0
+        self.images_delivered = 0
+
+    def copyStats(self):
+        images = max(1, self.images_delivered)
+        return {
+            "images": self.images_delivered,
+            "bytes_copied": self.bytes_copied,
+            "bytes_copied_per_image": self.bytes_copied / images,
+        }
+
+    def _sampleBuffers(self, count):
+        while len(self._buffers) < count:
+            buffer = SharedMemory(create=True, size=SAMPLE_BUFFER_BYTES)
+            self._buffers.append(buffer)
+        return self._buffers[:count]
+
+    def _releaseBuffers(self):
+        for buffer in self._buffers:
+            buffer.close()
+            buffer.unlink()
+        self._buffers = []
+
+    def setDocument(self, file_path, scale_factor, grayscale=False):
+        with self._condition:
+            self.generation += 1
+            self.file_path = file_path
+            self.mtime = os.path.getmtime(file_path)
+            self.scale_factor = scale_factor
+            self.grayscale = grayscale
+            self._queue.clear()
+            self._queued.clear()
+            self._in_flight.clear()
+            return self.generation
+
+    def submit(self, jobs, priority=PRIORITY_VISIBLE):
+        with self._condition:
+            for job in jobs:
+                if job in self._in_flight:
+                    continue
+                queued = self._queued.get(job)
+                if queued is not None and queued[0] <= priority:
+                    continue
+                self._sequence += 1
+                self._queued[job] = (priority, self._sequence)
+                heapq.heappush(self._queue, (priority, self._sequence, job))
+            self._condition.notify()
+
+    def retain(self, jobs):
+        # Forget queued jobs that are no longer wanted
+        with self._condition:
+            for job in list(self._queued):
+                if job not in jobs:
+                    del self._queued[job]
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self.wait()
+        self._releaseBuffers()
+
+    def _takeBatch(self):
+        # Called with the lock held: pop up to one job per worker, most urgent first
+        batch = []
+        while self._queue and len(batch) < RENDER_WORKERS:
+            priority, sequence, job = heapq.heappop(self._queue)
+            if self._queued.get(job) != (priority, sequence):
+                continue
+            del self._queued[job]
+            batch.append(job)
+        self._in_flight.update(batch)
+        return batch
 
     def run(self):
-        doc = fitz.open(self.file_path)
-        for i in range(len(doc)):
-            page = doc[i]
-            # Re-render the page at the desired scale factor
-            mat = fitz.Matrix(self.scale_factor, self.scale_factor)
-            pix = page.get_pixmap(matrix=mat)
-            image = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(image)
-            self.page_loaded.emit(i, pixmap)  # Emit page number and pixmap
-        doc.close()
+        while True:
+            with self._condition:
+                while not self._stopping and not self._queued:
+                    self._queue.clear()
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                batch = self._takeBatch()
+                generation = self.generation
+                file_path, mtime, scale_factor = self.file_path, self.mtime, self.scale_factor
+                grayscale = self.grayscale
+
+            # Jobs are rendered in parallel by the worker pool; imap hands them back in order
+            buffers = {buffer.name: buffer for buffer in self._sampleBuffers(len(batch))}
+            render = partial(_render_page_samples, file_path, mtime, scale_factor, grayscale)
+            results = render_pool().imap(render, zip(batch, buffers))
+            for result in results:
+                if generation != self.generation:
+                    # Superseded by another document or zoom level. The rest of the batch is
+                    # already running and writes into these buffers, which the next batch
+                    # reuses, so wait for it before moving on
+                    for _ in results:
+                        pass
+                    break
+                image = samples_to_image(result, buffers.get(result.buffer))
+                # The worker's copies, then the QImage detaching from the samples
+                self.bytes_copied += result.copied + image.sizeInBytes()
+                if result.samples is not None:
+                    # Inline samples were also read from the pipe and unpickled here
+                    self.bytes_copied += 2 * len(result.samples)
+                self.images_delivered += 1
+                job = result.job
+                page_cache.put(PageCache.key(file_path, mtime, job[0], scale_factor, job[1], grayscale), image)
+                # QPixmaps may only be created on the GUI thread, so hand over the image
+                self.page_loaded.emit(generation, job, image)
+
+            with self._condition:
+                if generation == self.generation:
+                    self._in_flight.difference_update(batch)
+
+
+class PageWidget(QWidget):
+    """Fixed-size placeholder for a single page.
+
+    Paints either one pixmap for the whole page or a set of tiles, each stretched
+    from the scale it was rendered at to the current size of the widget.
+    """
+
+    def __init__(self, width, height, base_size):
+        super().__init__()
+        self.setFixedSize(width, height)
+        # Page size in PDF points
+        self.base_size = base_size
+        self.pixmap = None
+        self.pixmap_scale = None
+        self.tiles = {}
+        self.tile_scale = None
+
+    def hasImage(self, tile, scale_factor):
+        if tile is None:
+            return self.pixmap is not None and self.pixmap_scale == scale_factor
+        return self.tile_scale == scale_factor and tile in self.tiles
+
+    def setImage(self, tile, pixmap, scale_factor):
+        if tile is None:
+            self.pixmap = pixmap
+            self.pixmap_scale = scale_factor
+            self.tiles = {}
+        else:
+            # A whole-page pixmap, if any, stays behind the tiles as a preview
+            if self.tile_scale != scale_factor:
+                self.tiles = {}
+                self.tile_scale = scale_factor
+            self.tiles[tile] = pixmap
+        self.update()
+
+    def retainTiles(self, tiles):
+        for tile in list(self.tiles):
+            if tile not in tiles:
+                del self.tiles[tile]
+
+    def hasContent(self):
+        return self.pixmap is not None or bool(self.tiles)
+
+    def byteCount(self):
+        pixmaps = list(self.tiles.values())
+        if self.pixmap is not None:
+            pixmaps.append(self.pixmap)
+        return sum(pixmap.width() * pixmap.height() * pixmap.depth() // 8 for pixmap in pixmaps)
+
+    def downsample(self, factor):
+        # Keep a small stand-in of the page; it no longer counts as rendered at any scale
+        if self.pixmap is None:
+            return
+        self.pixmap = self.pixmap.scaled(self.pixmap.size() * factor, Qt.IgnoreAspectRatio,
+                                         Qt.SmoothTransformation)
+        self.pixmap_scale = None
+        self.tiles = {}
+        self.update()
+
+    def clear(self):
+        self.pixmap = None
+        self.tiles = {}
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("#f0f0f0"))
+        # After a zoom step the old images are stretched over the new size until
+        # the sharp render arrives
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        if self.pixmap is not None:
+            painter.drawPixmap(self.rect(), self.pixmap)
+        if self.tiles:
+            ratio = self.width() / (self.base_size[0] * self.tile_scale)
+            for (column, row), pixmap in self.tiles.items():
+                target = QRectF(column * TILE_SIZE * ratio, row * TILE_SIZE * ratio,
+                                pixmap.width() * ratio, pixmap.height() * ratio)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+
 
 class PDFView(QWidget):
     def __init__(self):
         super().__init__()
         self.current_file_path = None
         self.current_scale_factor = 1.0
+        self.memory_limit = VIEWER_MEMORY_LIMIT
+        self.low_memory_mode = False
+        self._memory_pressure = False
+        self._applyCacheLimit()
+        self._generation = 0
+        self._scheduler = RenderScheduler()
+        self._scheduler.page_loaded.connect(self.displayPage)
+        self._scheduler.start()
+        if QApplication.instance() is not None:
+            QApplication.instance().aboutToQuit.connect(self._scheduler.stop)
+            QApplication.instance().aboutToQuit.connect(document_pool.close)
+        # Placeholder widgets, one per page, and the pages currently holding images
+        self._pages = []
+        self._holding = set()
         # Other initialization...
         self.pdf_page = QWidget()
         self.pdf_layout = QVBoxLayout(self.pdf_page)
         self.pdf_layout.setAlignment(Qt.AlignCenter)
+        self.pdf_layout.setSpacing(PAGE_SPACING)
 
         # Scroll area to contain the PDF page
         self.scroll_area = QScrollArea(self)
         self.scroll_area.setWidget(self.pdf_page)
         self.scroll_area.setWidgetResizable(True)
 
+        # Coalesce scroll and resize events into a single visibility pass.
+        self._visible_timer = QTimer(self)
+        self._visible_timer.setSingleShot(True)
+        self._visible_timer.setInterval(30)
+        self._visible_timer.timeout.connect(self._updateVisiblePages)
+        self.scroll_area.verticalScrollBar().valueChanged.connect(self._scheduleVisibleUpdate)
+
+        # Prefetch neighbouring pages once scrolling has stopped for a moment
+        self._scroll_direction = 1
+        self._last_scroll_value = 0
+        self._prefetch_timer = QTimer(self)
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.setInterval(PREFETCH_IDLE_MS)
+        self._prefetch_timer.timeout.connect(self._prefetchNeighbours)
+
+        # Re-render sharply once the zoom level has stopped changing
+        self._zoom_timer = QTimer(self)
+        self._zoom_timer.setSingleShot(True)
+        self._zoom_timer.setInterval(ZOOM_SETTLE_MS)
+        self._zoom_timer.timeout.connect(self._settleZoom)
+
         # Main layout for the entire PDFView widget
         self.main_layout = QHBoxLayout()
         self.main_layout.addWidget(self.scroll_area)
@@ -71,6 +607,17 @@ class PDFView(QWidget):
         self.zoom_in_button.setFixedSize(50, 50)
         self.zoom_out_button.setFixedSize(50, 50)
 
+        # Grayscale rendering toggle and readout of the memory held by the viewer
+        self.low_memory_button = QPushButton("G", self)
+        self.low_memory_button.setObjectName("zoomButton")
+        self.low_memory_button.setToolTip("Low-memory mode: render pages in grayscale")
+        self.low_memory_button.setCheckable(True)
+        self.low_memory_button.toggled.connect(self.setLowMemoryMode)
+        self.low_memory_button.setFixedSize(50, 50)
+        self.memory_label = QLabel(self)
+        self.memory_label.setObjectName("memoryLabel")
+        self._updateMemoryReadout()
+
         # Place buttons at the bottom-right of the scroll area
         self.zoom_in_button.move(self.scroll_area.width() - self.zoom_in_button.width() ,
                                  self.scroll_area.height() - 2 * self.zoom_in_button.height())
@@ -79,6 +626,8 @@ class PDFView(QWidget):
 
         # Ensure buttons stay on top of the scroll area
         self.zoom_out_button.raise_()
+        self.low_memory_button.raise_()
+        self.memory_label.raise_()
 
         # Handle window resizing to keep buttons at the correct position
         self.resizeEvent = self._on_resize
@@ -88,56 +637,364 @@ class PDFView(QWidget):
                                  self.scroll_area.height() - 2 * self.zoom_in_button.height() - 10)
         self.zoom_out_button.move(self.scroll_area.width() - self.zoom_out_button.width() - 10,
                                   self.scroll_area.height() - self.zoom_out_button.height() - 10)
+        self.low_memory_button.move(self.scroll_area.width() - self.low_memory_button.width() - 10,
+                                    self.scroll_area.height() - 3 * self.low_memory_button.height() - 10)
+        self.memory_label.move(20, self.scroll_area.height() - self.memory_label.height() - 10)
         self.zoom_in_button.show()
         self.zoom_out_button.show()
+        self.low_memory_button.show()
+        self._scheduleVisibleUpdate()
+
+    def setMemoryLimit(self, limit):
+        self.memory_limit = limit
+        self._applyCacheLimit()
+        self._enforceMemoryLimit()
+
+    def setLowMemoryMode(self, enabled):
+        # Grayscale pages take a third of the memory of RGB ones
+        self.low_memory_mode = enabled
+        self._applyCacheLimit()
+        if self.current_file_path:
+            self._generation = self._scheduler.setDocument(self.current_file_path, self._renderScale(),
+                                                           self.low_memory_mode)
+            for i in self._holding:
+                self._pages[i].clear()
+            self._holding = set()
+            self._updateVisiblePages()
+
+    def heldBytes(self):
+        return sum(self._pages[i].byteCount() for i in self._holding)
+
+    def _applyCacheLimit(self):
+        # page_cache counts toward the ceiling, so it only gets a share of it
+        share = LOW_MEMORY_CACHE_SHARE if self.low_memory_mode else PAGE_CACHE_SHARE
+        page_cache.resize(int(self.memory_limit * share))
+
+    def _heldLimit(self):
+        # What the ceiling leaves for the held pixmaps once page_cache is counted
+        return self.memory_limit - page_cache.stats()["bytes"]
 
     def zoomInClicked(self):
-        self.current_scale_factor += 0.2
-        self.startLoadingPDF(self.current_file_path)
+        self.setScaleFactor(self.current_scale_factor + ZOOM_STEP)
 
     def zoomOutClicked(self):
-        self.current_scale_factor = max(0.2, self.current_scale_factor - 0.2)
-        self.startLoadingPDF(self.current_file_path)
+        self.setScaleFactor(max(ZOOM_STEP, self.current_scale_factor - ZOOM_STEP))
+
+    def setScaleFactor(self, scale_factor):
+        ratio = scale_factor / self.current_scale_factor
+        self.current_scale_factor = scale_factor
+        if not self._pages:
+            return
+
+        # Resize the placeholders straight away; pages keep painting their current
+        # pixmap stretched to the new size as an instant preview
+        bar = self.scroll_area.verticalScrollBar()
+        anchor = bar.value() + bar.pageStep() / 2
+        for page in self._pages:
+            width, height = page.base_size
+            page.setFixedSize(round(width * scale_factor), round(height * scale_factor))
+        # Apply the new geometry now so the scroll range is right for the new anchor
+        self.pdf_layout.activate()
+        self.pdf_page.adjustSize()
+        bar.setValue(round(anchor * ratio - bar.pageStep() / 2))
+
+        self._zoom_timer.start()
+        self._scheduleVisibleUpdate()
+
+    def _settleZoom(self):
+        self._generation = self._scheduler.setDocument(self.current_file_path, self._renderScale(),
+                                                       self.low_memory_mode)
+        self._updateVisiblePages()
+
+    def _renderScale(self):
+        # Render at device resolution so pages stay sharp on HiDPI screens
+        return round(self.current_scale_factor * self.devicePixelRatioF(), 3)
 
     def startLoadingPDF(self, file_path):
 
         if not file_path:
             return
 
+        # Raises OSError for a missing file before the current document is touched
+        mtime = os.path.getmtime(file_path)
         self.current_file_path = file_path
+        self.current_mtime = mtime
+
+        # The render workers start with the first PDF, so a Library that is never
+        # used costs no worker processes
+        render_pool()
+
+        # Supersede every render job of the previous document
+        self._zoom_timer.stop()
+        self._generation = self._scheduler.setDocument(file_path, self._renderScale(),
+                                                       self.low_memory_mode)
 
-        # Clear previous pages
+        # Clear previous pages, releasing their pixmaps now rather than whenever
+        # deleteLater gets to them
+        for i in self._holding:
+            self._pages[i].clear()
         for i in reversed(range(self.pdf_layout.count())):
-            widget = self.pdf_layout.itemAt(i).widget()
+            widget = self.pdf_layout.takeAt(i).widget()
             if widget:
                 widget.deleteLater()
+        self._pages = []
+        self._holding = set()
+
+        # Lay out placeholders from the page sizes; nothing is rasterized yet. page.rect
+        # is the crop box turned by /Rotate, the shape the page and its tiles render at
+        with document_pool.open(file_path, self.current_mtime) as doc:
+            for i in range(len(doc)):
+                rect = doc[i].rect
+                page = PageWidget(round(rect.width * self.current_scale_factor),
+                                  round(rect.height * self.current_scale_factor),
+                                  (rect.width, rect.height))
+                self.pdf_layout.addWidget(page)
+                # Shown now rather than on the next event loop pass, so that
+                # scrollToPage can lay them out straight away
+                page.show()
+                self._pages.append(page)
+
+        self._scheduleVisibleUpdate()
+
+    def scrollToPage(self, page_number):
+        if not 0 <= page_number < len(self._pages):
+            return
+        # The placeholders have not been laid out yet right after loading
+        self.pdf_layout.activate()
+        self.pdf_page.adjustSize()
+        self.scroll_area.verticalScrollBar().setValue(self._pages[page_number].y())
+        self._scheduleVisibleUpdate()
+
+    def _scheduleVisibleUpdate(self, *args):
+        self._visible_timer.start()
+
+    def _visibleRange(self, margin=RENDER_MARGIN):
+        # Pages intersecting the viewport extended by margin on both sides
+        top = self.scroll_area.verticalScrollBar().value() - margin
+        bottom = top + self.scroll_area.viewport().height() + 2 * margin
+        first = bisect_left(_PageEdges(self._pages, QRect.bottom), top)
+        last = bisect_right(_PageEdges(self._pages, QRect.top), bottom)
+        return range(first, last)
+
+    def _isTiled(self, page_number, scale_factor):
+        width, height = self._pages[page_number].base_size
+        return width * height * scale_factor * scale_factor > TILE_THRESHOLD
+
+    def _wantedJobs(self, page_number, scale_factor):
+        # The whole page, or only the tiles that intersect the viewport plus TILE_MARGIN
+        if not self._isTiled(page_number, scale_factor):
+            return [(page_number, None)]
+
+        page = self._pages[page_number]
+        viewport = self.scroll_area.viewport()
+        area = QRect(page.mapFrom(viewport, QPoint(0, 0)), viewport.size())
+        area = area.adjusted(-TILE_MARGIN, -TILE_MARGIN, TILE_MARGIN, TILE_MARGIN) & page.rect()
+        if area.isEmpty():
+            return []
+
+        # Widget pixels to device pixels at the render scale
+        ratio = page.base_size[0] * scale_factor / page.width()
+        first_column = int(area.left() * ratio) // TILE_SIZE
+        last_column = int(area.right() * ratio) // TILE_SIZE
+        first_row = int(area.top() * ratio) // TILE_SIZE
+        last_row = int(area.bottom() * ratio) // TILE_SIZE
+        return [(page_number, (column, row))
+                for row in range(first_row, last_row + 1)
+                for column in range(first_column, last_column + 1)]
+
+    def _updateVisiblePages(self):
+        if not self._pages:
+            return
+
+        value = self.scroll_area.verticalScrollBar().value()
+        if value != self._last_scroll_value:
+            self._scroll_direction = 1 if value > self._last_scroll_value else -1
+            self._last_scroll_value = value
+
+        # Past the memory ceiling only the viewport itself is kept sharp, until enough
+        # memory is free again that the margin does not push it straight back over
+        held, limit = self.heldBytes(), self._heldLimit()
+        if held > limit:
+            self._memory_pressure = True
+        elif held < limit * MEMORY_RESUME_FRACTION:
+            self._memory_pressure = False
+        margin = 0 if self._memory_pressure else RENDER_MARGIN
+        visible = self._visibleRange(margin)
+        scale_factor = self._renderScale()
+
+        # Drop the pixmaps of pages that left the viewport
+        for i in list(self._holding):
+            if i not in visible:
+                self._pages[i].clear()
+                self._holding.discard(i)
+        self._updateMemoryReadout()
+
+        wanted = set()
+        missing = []
+        for i in visible:
+            page = self._pages[i]
+            jobs = self._wantedJobs(i, scale_factor)
+            wanted.update(jobs)
+            if self._isTiled(i, scale_factor) and page.tile_scale == scale_factor:
+                page.retainTiles({tile for _, tile in jobs})
+            for job in jobs:
+                if page.hasImage(job[1], scale_factor):
+                    continue
+                image = page_cache.get(PageCache.key(self.current_file_path, self.current_mtime,
+                                                     job[0], scale_factor, job[1], self.low_memory_mode))
+                if image is not None:
+                    self._showPage(job, image, scale_factor)
+                else:
+                    missing.append(job)
+
+        # While a zoom is settling the scheduler still renders the old scale
+        if self._zoom_timer.isActive():
+            return
+
+        # The screen (and so its devicePixelRatio) may have changed
+        if scale_factor != self._scheduler.scale_factor:
+            self._generation = self._scheduler.setDocument(self.current_file_path, scale_factor,
+                                                           self.low_memory_mode)
 
-        # Display initial "Loading" message
-        self.loading_label = QLabel("Loading pages...")
-        self.pdf_layout.addWidget(self.loading_label)
+        self._scheduler.retain(wanted)
+        self._scheduler.submit(missing, PRIORITY_VISIBLE)
+        self._prefetch_timer.start()
 
-        # Start the thread to load PDF pages
-        self.page_loader_thread = PageLoaderThread(file_path, self.current_scale_factor)
-        self.page_loader_thread.page_loaded.connect(self.displayPage)
-        self.page_loader_thread.start()
+    def _prefetchNeighbours(self):
+        if not self._pages or self._zoom_timer.isActive():
+            return
+
+        visible = self._visibleRange()
+        scale_factor = self._renderScale()
+        if self._scroll_direction > 0:
+            ahead = range(visible.stop, visible.stop + PREFETCH_AHEAD)
+            behind = range(visible.start - PREFETCH_BEHIND, visible.start)
+        else:
+            ahead = range(visible.start - PREFETCH_AHEAD, visible.start)
+            behind = range(visible.stop, visible.stop + PREFETCH_BEHIND)
+
+        # Tiles depend on where the viewport ends up, so only whole pages are prefetched
+        jobs = [(i, None) for i in list(ahead) + list(behind)
+                if 0 <= i < len(self._pages)
+                and not self._isTiled(i, scale_factor)
+                and PageCache.key(self.current_file_path, self.current_mtime,
+                                  i, scale_factor, None, self.low_memory_mode) not in page_cache]
+        self._scheduler.submit(jobs, PRIORITY_PREFETCH)
+
+    @pyqtSlot(int, object, QImage)
+    def displayPage(self, generation, job, image):
+        # Ignore pages rendered for a document or zoom level that is no longer shown
+        if generation != self._generation:
+            return
+        # Prefetched pages stay in page_cache until they scroll into view
+        if job[0] not in self._visibleRange():
+            return
+        self._showPage(job, image, self._scheduler.scale_factor)
+
+    def _showPage(self, job, image, scale_factor):
+        # Display the actual page, or one tile of it
+        page_number, tile = job
+        if self.low_memory_mode:
+            # Keep grayscale pixmaps at one byte per pixel instead of converting to 32-bit
+            pixmap = QPixmap.fromImage(image, Qt.NoFormatConversion)
+        else:
+            pixmap = QPixmap.fromImage(image)
+        page = self._pages[page_number]
+        if tile is None and scale_factor == self._renderScale():
+            size = pixmap.size() / self.devicePixelRatioF()
+            if page.size() != size:
+                # The page size did not match the rendered page (e.g. rounding of odd sizes)
+                page.setFixedSize(size)
+                page.base_size = (pixmap.width() / scale_factor, pixmap.height() / scale_factor)
+        page.setImage(tile, pixmap, scale_factor)
+        self._holding.add(page_number)
+        self._enforceMemoryLimit()
+
+    def _enforceMemoryLimit(self):
+        held = self.heldBytes()
+        limit = self._heldLimit()
+        if held > limit:
+            self._memory_pressure = True
+            # Pages furthest from the viewport go first; pages on screen are never touched
+            on_screen = self._visibleRange(0)
+            centre = (on_screen.start + on_screen.stop) / 2
+            off_screen = sorted((i for i in self._holding if i not in on_screen),
+                                key=lambda i: abs(i - centre), reverse=True)
+            for i in off_screen:
+                if held <= limit:
+                    break
+                page = self._pages[i]
+                before = page.byteCount()
+                page.downsample(PREVIEW_FACTOR)
+                held -= before - page.byteCount()
+            for i in off_screen:
+                if held <= limit:
+                    break
+                held -= self._pages[i].byteCount()
+                self._pages[i].clear()
+                self._holding.discard(i)
+        self._updateMemoryReadout(held)
+
+    def _updateMemoryReadout(self, held=None):
+        if held is None:
+            held = self.heldBytes()
+        stats = page_cache.stats()
+        self.memory_label.setText(f"{(held + stats['bytes']) / 2**20:.1f} / {self.memory_limit / 2**20:.0f} MB")
+        self.memory_label.setToolTip(f"Page cache: {stats['bytes'] / 2**20:.1f} MB in {stats['entries']} images, "
+                                     f"{stats['hits']} hits, {stats['misses']} misses, "
+                                     f"{stats['evictions']} evictions")
+        self.memory_label.adjustSize()
 
+class CatalogScanThread(QThread):
+    """Brings the library catalog of a folder up to date in the background."""
+    updated = pyqtSignal(object)  # Emit a CatalogEntry per (re)read file
+    removed = pyqtSignal(str)  # Emit the path of a file that disappeared
+
+    def __init__(self, catalog, folder):
+        super().__init__()
+        self.catalog = catalog
+        self.folder = folder
+
+    def run(self):
+        self.catalog.scan(self.folder, self.updated.emit, self.removed.emit, self.isInterruptionRequested)
+
+
+class IndexBuildThread(QThread):
+    """Brings the full-text search index of a folder up to date in the background.
+
+    With a retriever, the passages the editor retrieves from are updated after it.
+    """
+    progress = pyqtSignal(int, int)  # Emit files indexed and files to index
+
+    def __init__(self, index, folder, retriever=None):
+        super().__init__()
+        self.index = index
+        self.folder = folder
+        self.retriever = retriever
 
-    @pyqtSlot(int, QPixmap)
-    def displayPage(self, page_number, pixmap):
-        # Remove the loading label after the first page
-        if hasattr(self, 'loading_label'):
-            self.loading_label.deleteLater()
-            del self.loading_label
+    def run(self):
+        self.index.update(self.folder, self.isInterruptionRequested, self.progress.emit)
+        if self.retriever is not None and not self.isInterruptionRequested():
+            self.retriever.update(self.isInterruptionRequested)
 
-        # Display the actual page
-        image_label = QLabel()
-        image_label.setPixmap(pixmap)
-        self.pdf_layout.addWidget(image_label)
 
 class Library(QWidget):
     def __init__(self):
         super().__init__()
 
+        # Metadata of PDFs already seen comes from the catalog without reopening them
+        self._catalog = LibraryCatalog()
+        self._scan_thread = None
+        # Folders waiting to be scanned after the running scan, e.g. directories the watcher saw change
+        self._pending_scans = []
+        self._search_index = SearchIndex()
+        # Passages for the editor's Library requests are cut once the index is built
+        self._retriever = Retriever(self._search_index)
+        self._index_thread = None
+        if QApplication.instance() is not None:
+            QApplication.instance().aboutToQuit.connect(self._stopScan)
+            QApplication.instance().aboutToQuit.connect(self._stopIndexing)
+
         self._b_folder_open = QPushButton('Folders')
         self._b_folder_open.setObjectName('folder')
         self._b_folder_open.clicked.connect(self.open_folder)
@@ -145,15 +1002,37 @@ class Library(QWidget):
         #creating an object of pdf class
         self._pdf_view = PDFView()
 
-        self._file_tree = QTreeWidget()
-        self._file_tree.setHeaderHidden(True)
+        # Directories are listed when expanded; only PDFs are shown
+        self._file_tree = LazyFileTree(('.pdf',))
         #loading pdf based on click
         self._file_tree.itemClicked.connect(self.view_pdf)
         self._file_tree.setObjectName('tree_view')
+        self._file_tree.setIconSize(QSize(30, 40))
+        self._file_tree.itemsAdded.connect(self._decorateItems)
+        # PDFs added to a watched directory are read into the catalog like the first scan
+        self._file_tree.directoryRefreshed.connect(self._scanFolder)
+
+        # Full-text search over the indexed PDFs, run once typing pauses
+        self._search_box = QLineEdit()
+        self._search_box.setObjectName('searchBox')
+        self._search_box.setPlaceholderText('Search PDFs')
+        self._search_box.setClearButtonEnabled(True)
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(150)
+        self._search_timer.timeout.connect(self._runSearch)
+        self._search_box.textChanged.connect(self._search_timer.start)
+        self._search_results = QListWidget()
+        self._search_results.setObjectName('searchResults')
+        self._search_results.setWordWrap(True)
+        self._search_results.itemClicked.connect(self._openSearchResult)
+        self._search_results.hide()
 
         self._left_side_layout = QVBoxLayout()
         self._left_side_layout.setAlignment(Qt.AlignTop | Qt.AlignRight)
         self._left_side_layout.addWidget(self._b_folder_open)
+        self._left_side_layout.addWidget(self._search_box)
+        self._left_side_layout.addWidget(self._search_results)
         self._left_side_layout.addWidget(self._file_tree)
 
 
@@ -187,30 +1066,120 @@ class Library(QWidget):
         self.folder = QFileDialog.getExistingDirectory(self, 'Select Folder')
 
         if self.folder:
-            self._file_tree.clear()
             self.populate_tree(self.folder)
 
     def populate_tree(self, folder_path):
-        root_item = QTreeWidgetItem(self._file_tree)
-        root_item.setText(0, os.path.basename(folder_path))
-
-        root_item.setData(0, Qt.UserRole, folder_path)
-        self.add_tree_items(root_item, folder_path)
-        root_item.setExpanded(True)
-
-    def add_tree_items(self, parent_item, path):
-        extension = ['.pdf']
-        for item_name in os.listdir(path):
-            item_path = os.path.join(path, item_name)
-
-            if os.path.isdir(item_path):
-                tree_item = QTreeWidgetItem(parent_item)
-                tree_item.setText(0, item_name)
-                tree_item.setData(0, Qt.UserRole, item_path)
-                self.add_tree_items(tree_item, item_path)
-                tree_item.setExpanded(False)
-            else:
-                if any(item_name.endswith(ext) for ext in extension):
-                    tree_item = QTreeWidgetItem(parent_item)
-                    tree_item.setText(0, item_name)
-                    tree_item.setData(0,Qt.UserRole , item_path)
\ No newline at end of file
+        self._file_tree.setRoot(folder_path)
+
+        self._stopScan()
+        self._scanFolder(folder_path)
+
+        self._stopIndexing()
+        self._index_thread = IndexBuildThread(self._search_index, folder_path, self._retriever)
+        self._index_thread.progress.connect(self._onIndexProgress)
+        self._index_thread.finished.connect(self._runSearch)
+        self._index_thread.start()
+
+    def _scanFolder(self, folder):
+        # Scans run one at a time; a changed directory is caught up after the running scan
+        if folder not in self._pending_scans:
+            self._pending_scans.append(folder)
+        if self._scan_thread is None:
+            self._startNextScan()
+
+    def _startNextScan(self):
+        # A finished signal of a scan stopped by _stopScan may arrive while the next one runs
+        if self._scan_thread is not None and not self._scan_thread.isFinished():
+            return
+        self._scan_thread = None
+        if not self._pending_scans:
+            return
+        self._scan_thread = CatalogScanThread(self._catalog, self._pending_scans.pop(0))
+        self._scan_thread.updated.connect(self._onUpdated)
+        self._scan_thread.removed.connect(self._onRemoved)
+        self._scan_thread.finished.connect(self._startNextScan)
+        self._scan_thread.start()
+
+    def _stopScan(self):
+        self._pending_scans = []
+        if self._scan_thread is not None:
+            self._scan_thread.requestInterruption()
+            self._scan_thread.wait()
+            self._scan_thread = None
+
+    def _stopIndexing(self):
+        if self._index_thread is not None:
+            self._index_thread.requestInterruption()
+            self._index_thread.wait()
+            self._index_thread = None
+        self._search_box.setPlaceholderText('Search PDFs')
+
+    def _onIndexProgress(self, done, total):
+        if done < total:
+            self._search_box.setPlaceholderText(f'Search PDFs (indexing {done}/{total})')
+        else:
+            self._search_box.setPlaceholderText('Search PDFs')
+
+    def _runSearch(self):
+        self._search_results.clear()
+        query = self._search_box.text()
+        folder = getattr(self, 'folder', None) or None
+        hits = self._search_index.search(query, folder) if query.strip() else []
+        for hit in hits:
+            item = QListWidgetItem(f"{os.path.basename(hit.path)}, p. {hit.page + 1}\n{hit.snippet}")
+            item.setToolTip(hit.path)
+            item.setData(Qt.UserRole, (hit.path, hit.page))
+            self._search_results.addItem(item)
+        self._search_results.setVisible(bool(query.strip()))
+
+    def _openSearchResult(self, item):
+        path, page_number = item.data(Qt.UserRole)
+        if path != self._pdf_view.current_file_path:
+            try:
+                self._pdf_view.startLoadingPDF(path)
+            except OSError as e:
+                # The hit is stale: the file was deleted or moved since it was indexed
+                print(e)
+                self._search_index.forget(path)
+                self._search_results.takeItem(self._search_results.row(item))
+                return
+        self._pdf_view.scrollToPage(page_number)
+        item = self._file_tree.itemForPath(path)
+        if item is not None:
+            self._file_tree.setCurrentItem(item)
+
+    def _describeItem(self, item, entry):
+        lines = [entry.title or os.path.basename(entry.path)]
+        if entry.page_count is not None:
+            lines.append(f"{entry.page_count} pages")
+        lines.append(f"{entry.size / 2**20:.1f} MB")
+        item.setToolTip(0, "\n".join(lines))
+
+    def _decorateItems(self, items):
+        # Metadata and thumbnails come from the catalog as items are listed
+        paths = []
+        for item in items:
+            if not item.data(0, IS_DIR_ROLE):
+                path = item.data(0, Qt.UserRole)
+                entry = self._catalog.entry(path)
+                if entry is not None:
+                    self._describeItem(item, entry)
+                paths.append(path)
+        self._setThumbnails(paths)
+
+    def _setThumbnails(self, paths):
+        for path, png in self._catalog.thumbnails(paths).items():
+            pixmap = QPixmap()
+            item = self._file_tree.itemForPath(path)
+            if item is not None and pixmap.loadFromData(png, "PNG"):
+                item.setIcon(0, QIcon(pixmap))
+
+    def _onUpdated(self, entry):
+        # Files the tree has not listed yet are decorated when they are
+        item = self._file_tree.itemForPath(entry.path)
+        if item is not None:
+            self._describeItem(item, entry)
+            self._setThumbnails([entry.path])
+
+    def _onRemoved(self, path):
+        self._file_tree.removePath(path)
@@ -0,0 +1,61 @@
+import os
+import threading
+from collections import namedtuple
+
+
+# Commands offered in the prompt combo box, in order, with the file holding their
+# instructions (None for a command sent without instructions).
+PromptCommand = namedtuple("PromptCommand", "name file_name")
+DEFAULT_COMMANDS = (
+    PromptCommand("None", None),
+    PromptCommand("explain", "explain.txt"),
+    PromptCommand("fixit", "fixt.txt"),
+    PromptCommand("comment", "comment.txt"),
+)
+
+
+class PromptRegistry:
+    """The prompt commands and their instruction templates, read once and kept in memory.
+
+    Templates are loaded when the registry is created. Asking for one only
+    stats its file, and reads it again when its mtime changed, so an edited
+    template is picked up on the next request without a restart.
+    """
+
+    def __init__(self, directory, commands=DEFAULT_COMMANDS):
+        self.directory = directory
+        self.commands = list(commands)
+        self._templates = {}
+        self._lock = threading.Lock()
+        for command in self.commands:
+            self.template(command.name)
+
+    def names(self):
+        return [command.name for command in self.commands]
+
+    def command(self, name):
+        for command in self.commands:
+            if command.name == name:
+                return command
+        raise KeyError(name)
+
+    def template(self, name):
+        """Return the instructions of the command called name, reloading them if the file changed."""
+        command = self.command(name)
+        if command.file_name is None:
+            return ""
+        path = os.path.join(self.directory, command.file_name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            # A deleted template keeps its last known text
+            return self._templates.get(name, (None, ""))[1]
+        with self._lock:
+            cached = self._templates.get(name)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        with open(path, encoding="utf-8") as file:
+            text = file.read()
+        with self._lock:
+            self._templates[name] = (mtime, text)
+        return text
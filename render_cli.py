@@ -0,0 +1,144 @@
+"""Rasterize every page of a folder of PDFs to PNG or WebP without the GUI.
+
+    python render_cli.py SOURCE OUTPUT [--dpi 150] [--format png|webp]
+
+Pages are rendered by the same worker code as the PDF viewer, in a pool of
+processes. Each finished page is appended to OUTPUT/manifest.jsonl, so an
+interrupted run picks up where it stopped when started again.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from functools import partial
+from multiprocessing import get_context
+
+from catalog import walk_pdfs
+from library import RENDER_WORKERS, document_pool, _render_page_samples, samples_to_image
+
+
+MANIFEST_NAME = "manifest.jsonl"
+# Seconds between two progress lines.
+PROGRESS_INTERVAL = 2.0
+
+
+def page_output(output, relative_path, page_number, image_format):
+    stem = os.path.splitext(relative_path)[0]
+    return os.path.join(output, stem, f"page-{page_number + 1:04d}.{image_format}")
+
+
+def read_manifest(path):
+    """Return the set of finished (source, mtime, page, dpi, format, grayscale) keys."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as manifest:
+        for line in manifest:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run
+                continue
+            if os.path.exists(record["output"]):
+                done.add((record["source"], record["mtime"], record["page"], record["dpi"],
+                          record["format"], record["grayscale"]))
+    return done
+
+
+def export_page(options, task):
+    # Runs in a worker: renders one page and encodes it there, so only the task
+    # and an error message, if any, travel back to the parent process.
+    source, mtime, page_number, output_path = task
+    try:
+        result = _render_page_samples(source, mtime, options.dpi / 72, options.grayscale,
+                                      ((page_number, None), None))
+        image = samples_to_image(result)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if not image.save(output_path, options.format.upper(), options.quality):
+            return task, f"could not write {output_path}"
+    except Exception as e:
+        return task, str(e)
+    return task, None
+
+
+def collect_tasks(options, done):
+    tasks = []
+    for source, _, mtime in sorted(walk_pdfs(options.source)):
+        try:
+            with document_pool.open(source, mtime) as doc:
+                page_count = len(doc)
+        except Exception as e:
+            print(f"skipping {source}: {e}", file=sys.stderr)
+            continue
+        relative_path = os.path.relpath(source, options.source)
+        for page_number in range(page_count):
+            key = (source, mtime, page_number, options.dpi, options.format, options.grayscale)
+            if key not in done:
+                output_path = page_output(options.output, relative_path, page_number, options.format)
+                tasks.append((source, mtime, page_number, output_path))
+    # The workers only need their own handles
+    document_pool.close()
+    return tasks
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rasterize a folder of PDFs to images.")
+    parser.add_argument("source", help="folder searched recursively for PDFs")
+    parser.add_argument("output", help="folder receiving the images and the manifest")
+    parser.add_argument("--dpi", type=int, default=150, help="resolution of the images (default 150)")
+    parser.add_argument("--format", choices=("png", "webp"), default="png")
+    parser.add_argument("--quality", type=int, default=-1,
+                        help="WebP quality 0-100, or PNG compression; -1 for the default")
+    parser.add_argument("--grayscale", action="store_true", help="render in 8-bit grayscale")
+    parser.add_argument("--workers", type=int, default=RENDER_WORKERS,
+                        help=f"render processes (default {RENDER_WORKERS})")
+    options = parser.parse_args(argv)
+    options.source = os.path.abspath(options.source)
+    options.output = os.path.abspath(options.output)
+    return options
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    os.makedirs(options.output, exist_ok=True)
+    manifest_path = os.path.join(options.output, MANIFEST_NAME)
+    done = read_manifest(manifest_path)
+    tasks = collect_tasks(options, done)
+    print(f"{len(tasks)} pages to render, {len(done)} already done", file=sys.stderr)
+    if not tasks:
+        return 0
+
+    start = time.perf_counter()
+    last_report = start
+    rendered = 0
+    failed = 0
+    with open(manifest_path, "a") as manifest, \
+            get_context("spawn").Pool(max(1, options.workers)) as pool:
+        for (source, mtime, page_number, output_path), error in pool.imap_unordered(
+                partial(export_page, options), tasks, chunksize=4):
+            if error is not None:
+                # Left out of the manifest, so the next run tries the page again
+                print(f"{source} page {page_number + 1}: {error}", file=sys.stderr)
+                failed += 1
+                continue
+            record = {"source": source, "mtime": mtime, "page": page_number, "dpi": options.dpi,
+                      "format": options.format, "grayscale": options.grayscale, "output": output_path}
+            manifest.write(json.dumps(record) + "\n")
+            # Flushed per page so an interrupted run loses at most the pages in flight
+            manifest.flush()
+            rendered += 1
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                print(f"{rendered}/{len(tasks)} pages, {rendered / (now - start):.1f} pages/s",
+                      file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    print(f"rendered {rendered} pages in {elapsed:.1f} s ({rendered / elapsed:.1f} pages/s)"
+          + (f", {failed} failed" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
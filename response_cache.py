@@ -0,0 +1,112 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from app_paths import ThreadConnections, data_path
+
+
+# Answers kept in memory, answers kept on disk, and how long an answer stays valid.
+MEMORY_ENTRIES = 64
+DISK_ENTRIES = 500
+CACHE_TTL = 7 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    answer TEXT NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_used ON responses (used);
+"""
+
+
+def response_key(*parts):
+    """Return the SHA-256 hex digest identifying a request made of parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = (part or "").encode("utf-8")
+        # Length-prefixed so that moving text from one part to the next changes the key
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """AI answers by request key: an in-memory LRU in front of an SQLite LRU store.
+
+    Entries older than ttl seconds are ignored and dropped; the store keeps at
+    most disk_entries answers, evicting the least recently used.
+    """
+
+    def __init__(self, db_path=None, memory_entries=MEMORY_ENTRIES, disk_entries=DISK_ENTRIES, ttl=CACHE_TTL):
+        self.db_path = db_path or data_path("responses.sqlite3")
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = ThreadConnections(self.db_path)
+        db = self._db.get()
+        db.executescript(SCHEMA)
+        db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+        db = self._db.get()
+        row = db.execute("SELECT answer, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None and now - row[1] >= self.ttl:
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            db.commit()
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, row[0], row[1])
+        db.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+        db.commit()
+        return row[0]
+
+    def put(self, key, answer):
+        now = time.time()
+        with self._lock:
+            self._remember(key, answer, now)
+        db = self._db.get()
+        db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, answer, now, now))
+        db.execute("DELETE FROM responses WHERE key IN "
+                   "(SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.disk_entries,))
+        db.commit()
+
+    def _remember(self, key, answer, created):
+        self._memory[key] = (answer, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        db = self._db.get()
+        db.execute("DELETE FROM responses")
+        db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,150 @@
+import math
+import os
+import threading
+from collections import Counter, namedtuple
+
+from app_paths import ThreadConnections, data_path
+from search_index import SearchIndex, tokenize
+
+
+# Words per passage, and words shared by consecutive passages of a page.
+CHUNK_WORDS = 150
+CHUNK_OVERLAP = 30
+# Passages considered for a prompt, and the tokens they may add to it together.
+TOP_K = 5
+CONTEXT_TOKEN_BUDGET = 1500
+# BM25 parameters.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_docs (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_path ON chunks (path);
+CREATE TABLE IF NOT EXISTS chunk_postings (
+    term TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (term, chunk_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chunk_postings_chunk ON chunk_postings (chunk_id);
+"""
+
+Passage = namedtuple("Passage", "path page text score")
+
+
+def estimate_tokens(text):
+    """Rough token count of text for budgeting, at about four characters per token."""
+    return len(text) // 4 + 1
+
+
+def split_chunks(text):
+    """Split the text of a page into overlapping passages of CHUNK_WORDS words."""
+    words = text.split()
+    step = CHUNK_WORDS - CHUNK_OVERLAP
+    return [" ".join(words[start:start + CHUNK_WORDS])
+            for start in range(0, max(len(words) - CHUNK_OVERLAP, 1), step)
+            if words[start:start + CHUNK_WORDS]]
+
+
+def format_passages(passages):
+    """Render passages as a prompt section naming the file and page of each."""
+    if not passages:
+        return ""
+    parts = ["Use these passages from the user's library where they are relevant:"]
+    for passage in passages:
+        parts.append(f"[{os.path.basename(passage.path)}, page {passage.page + 1}]\n{passage.text}")
+    return "\n\n".join(parts) + "\n\n"
+
+
+class Retriever:
+    """BM25 passage index over the PDFs of the full-text search index.
+
+    Passages are cut from the page text the SearchIndex already extracted, so
+    no PDF is reopened; update() only re-chunks documents whose mtime changed.
+    It runs after the search index is built, never on a request: retrieve()
+    only reads.
+    """
+
+    def __init__(self, search_index=None, db_path=None):
+        self.search_index = search_index or SearchIndex()
+        self.db_path = db_path or data_path("retrieval.sqlite3")
+        self._db = ThreadConnections(self.db_path)
+        self._update_lock = threading.Lock()
+        db = self._db.get()
+        db.executescript(SCHEMA)
+        db.commit()
+
+    def update(self, should_stop=None):
+        """Bring the passages in line with the documents of the search index."""
+        with self._update_lock:
+            db = self._db.get()
+            known = dict(db.execute("SELECT path, mtime FROM chunk_docs"))
+            indexed = self.search_index.documents()
+            for path in set(known) - set(indexed):
+                self._remove(path)
+            db.commit()
+            for path, mtime in indexed.items():
+                if should_stop is not None and should_stop():
+                    break
+                if known.get(path) != mtime:
+                    self._remove(path)
+                    self._add(path, mtime, self.search_index.page_texts(path))
+                    db.commit()
+
+    def _remove(self, path):
+        db = self._db.get()
+        db.execute("DELETE FROM chunk_postings WHERE chunk_id IN (SELECT id FROM chunks WHERE path = ?)", (path,))
+        db.execute("DELETE FROM chunks WHERE path = ?", (path,))
+        db.execute("DELETE FROM chunk_docs WHERE path = ?", (path,))
+
+    def _add(self, path, mtime, pages):
+        db = self._db.get()
+        db.execute("INSERT INTO chunk_docs VALUES (?, ?)", (path, mtime))
+        for page, text in enumerate(pages):
+            for chunk in split_chunks(text):
+                terms = Counter(tokenize(chunk))
+                chunk_id = db.execute("INSERT INTO chunks (path, page, text, length) VALUES (?, ?, ?, ?)",
+                                      (path, page, chunk, sum(terms.values()))).lastrowid
+                db.executemany("INSERT INTO chunk_postings VALUES (?, ?, ?)",
+                               ((term, chunk_id, count) for term, count in terms.items()))
+
+    def retrieve(self, query, top_k=TOP_K, token_budget=CONTEXT_TOKEN_BUDGET):
+        """Return the best passages for query, in score order, fitting in token_budget."""
+        db = self._db.get()
+        total, average_length = db.execute("SELECT COUNT(*), AVG(length) FROM chunks").fetchone()
+        if not total:
+            return []
+
+        scores = Counter()
+        for term in set(tokenize(query)):
+            rows = db.execute("SELECT p.chunk_id, p.count, c.length FROM chunk_postings p "
+                              "JOIN chunks c ON c.id = p.chunk_id WHERE p.term = ?", (term,)).fetchall()
+            if not rows:
+                continue
+            # Terms found in most passages still count, weighted down by their idf
+            idf = math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+            for chunk_id, count, length in rows:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                scores[chunk_id] += idf * count * (BM25_K1 + 1) / (count + norm)
+
+        passages = []
+        budget = token_budget
+        for chunk_id, score in scores.most_common(top_k):
+            path, page, text = db.execute("SELECT path, page, text FROM chunks WHERE id = ?",
+                                          (chunk_id,)).fetchone()
+            # Passages that do not fit are skipped; a lower-ranked shorter one may still fit
+            cost = estimate_tokens(text)
+            if cost <= budget:
+                budget -= cost
+                passages.append(Passage(path, page, text, score))
+        return passages
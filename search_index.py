@@ -0,0 +1,189 @@
+import os
+import re
+from collections import Counter, namedtuple
+from multiprocessing import get_context
+
+import fitz  # PyMuPDF
+
+from app_paths import WORKER_PROCESSES, ThreadConnections, data_path
+from catalog import walk_pdfs
+
+
+# Characters of context shown on each side of a match.
+SNIPPET_CONTEXT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    doc_id INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (doc_id, page)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id, page)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+"""
+
+SearchHit = namedtuple("SearchHit", "path page score snippet")
+
+_TOKEN = re.compile(r"\w\w+")
+
+
+def tokenize(text):
+    """Split text into lower-case index terms of at least two characters."""
+    return _TOKEN.findall(text.lower())
+
+
+def extract_pdf_text(path):
+    # Runs in an index worker; returns (path, [text of each page]) or (path, None)
+    try:
+        with fitz.open(path) as doc:
+            return path, [page.get_text() for page in doc]
+    except Exception as e:
+        print(e)
+        return path, None
+
+
+class SearchIndex:
+    """Inverted index over the text of the PDFs in the library folders.
+
+    Postings map a term to the (document, page) pairs containing it, so a query
+    only touches the rows of its own terms. update() re-extracts a file only when
+    its size or mtime changed.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or data_path("search.sqlite3")
+        self._db = ThreadConnections(self.db_path)
+        db = self._db.get()
+        db.executescript(SCHEMA)
+        db.commit()
+
+    def update(self, folder, should_stop=None, on_progress=None):
+        """Index new and changed PDFs below folder and forget the removed ones.
+
+        on_progress receives (files done, files to do) after each file.
+        """
+        folder = os.path.join(os.path.abspath(folder), "")
+        db = self._db.get()
+        known = {path: (doc_id, size, mtime) for doc_id, path, size, mtime in db.execute(
+            "SELECT id, path, size, mtime FROM docs WHERE substr(path, 1, ?) = ?",
+            (len(folder), folder))}
+
+        found = {path: (size, mtime) for path, size, mtime in walk_pdfs(folder)}
+        for path in set(known) - set(found):
+            self._remove(known[path][0])
+        db.commit()
+
+        changed = [path for path, stat in found.items()
+                   if path not in known or known[path][1:] != stat]
+        if not changed:
+            return
+
+        # spawn instead of fork: the GUI process runs Qt threads
+        with get_context("spawn").Pool(min(WORKER_PROCESSES, len(changed))) as pool:
+            for done, (path, pages) in enumerate(pool.imap_unordered(extract_pdf_text, changed), 1):
+                if should_stop is not None and should_stop():
+                    pool.terminate()
+                    break
+                if path in known:
+                    self._remove(known[path][0])
+                if pages is not None:
+                    self._add(path, *found[path], pages)
+                db.commit()
+                if on_progress is not None:
+                    on_progress(done, len(changed))
+
+    def forget(self, path):
+        """Drop path from the index, e.g. a file deleted since the last update."""
+        db = self._db.get()
+        for (doc_id,) in db.execute("SELECT id FROM docs WHERE path = ?", (path,)).fetchall():
+            self._remove(doc_id)
+        db.commit()
+
+    def _remove(self, doc_id):
+        db = self._db.get()
+        db.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+        db.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+        db.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+
+    def _add(self, path, size, mtime, pages):
+        db = self._db.get()
+        doc_id = db.execute("INSERT INTO docs (path, size, mtime) VALUES (?, ?, ?)",
+                            (path, size, mtime)).lastrowid
+        db.executemany("INSERT INTO pages VALUES (?, ?, ?)",
+                       ((doc_id, page, text) for page, text in enumerate(pages)))
+        db.executemany("INSERT INTO postings VALUES (?, ?, ?, ?)",
+                       ((term, doc_id, page, count)
+                        for page, text in enumerate(pages)
+                        for term, count in Counter(tokenize(text)).items()))
+
+    def documents(self):
+        """Return {path: mtime} for every indexed PDF."""
+        return dict(self._db.get().execute("SELECT path, mtime FROM docs"))
+
+    def page_texts(self, path):
+        """Return the text of each page of an indexed PDF, in page order."""
+        return [text for text, in self._db.get().execute(
+            "SELECT pages.text FROM pages JOIN docs ON docs.id = pages.doc_id "
+            "WHERE docs.path = ? ORDER BY pages.page", (path,))]
+
+    def search(self, query, folder=None, limit=50):
+        """Return up to limit SearchHits for the pages containing every term of query.
+
+        The last term also matches as a prefix, so results follow the user's typing.
+        With folder given, only PDFs below it are searched.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        db = self._db.get()
+        allowed = None
+        if folder is not None:
+            folder = os.path.join(os.path.abspath(folder), "")
+            allowed = {doc_id for doc_id, in db.execute(
+                "SELECT id FROM docs WHERE substr(path, 1, ?) = ?", (len(folder), folder))}
+        scores = None
+        for i, term in enumerate(terms):
+            if i == len(terms) - 1:
+                rows = db.execute("SELECT doc_id, page, count FROM postings WHERE term >= ? AND term < ?",
+                                  (term, term + "\uffff"))
+            else:
+                rows = db.execute("SELECT doc_id, page, count FROM postings WHERE term = ?", (term,))
+            matches = Counter()
+            for doc_id, page, count in rows:
+                if allowed is None or doc_id in allowed:
+                    matches[(doc_id, page)] += count
+            if scores is None:
+                scores = matches
+            else:
+                scores = Counter({key: scores[key] + count for key, count in matches.items() if key in scores})
+            if not scores:
+                return []
+
+        hits = []
+        for (doc_id, page), score in scores.most_common(limit):
+            path, text = db.execute(
+                "SELECT docs.path, pages.text FROM pages JOIN docs ON docs.id = pages.doc_id "
+                "WHERE pages.doc_id = ? AND pages.page = ?", (doc_id, page)).fetchone()
+            hits.append(SearchHit(path, page, score, self._snippet(text, terms[0])))
+        return hits
+
+    @staticmethod
+    def _snippet(text, term):
+        position = text.lower().find(term)
+        start = max(0, position - SNIPPET_CONTEXT)
+        snippet = text[start:position + len(term) + SNIPPET_CONTEXT]
+        return " ".join(snippet.split())
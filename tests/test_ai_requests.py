@@ -0,0 +1,208 @@
+import threading
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import ai_requests
+from ai_requests import AiRequestManager, RequestCancelled
+
+
+class FakeStream:
+    """A streamed answer that yields pieces until closed, like a Gemini response."""
+
+    def __init__(self, pieces=None, delay=0.01):
+        self.pieces = pieces
+        self.delay = delay
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        count = 0
+        while not self.closed.wait(self.delay):
+            if self.pieces is not None and count == len(self.pieces):
+                return
+            yield self.pieces[count] if self.pieces is not None else str(count)
+            count += 1
+        raise ConnectionError("stream closed")
+
+    def close(self):
+        self.closed.set()
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.001)
+
+
+def test_identical_calls_are_merged():
+    manager = AiRequestManager()
+    started = []
+
+    def start():
+        started.append(1)
+        return FakeStream(["a", "b", "c"])
+
+    first = manager.stream("key", start)
+    second = manager.stream("key", start)
+    results = []
+    reader = threading.Thread(target=lambda: results.append("".join(first)), daemon=True)
+    reader.start()
+    assert "".join(second) == "abc"
+    reader.join()
+    assert results == ["abc"]
+    assert len(started) == 1
+
+
+def test_late_subscriber_replays_received_pieces():
+    manager = AiRequestManager()
+    stream = FakeStream(["a", "b", "c"], delay=0.05)
+    first = iter(manager.stream("key", lambda: stream))
+    assert next(first) == "a"
+    second = manager.stream("key", lambda: FakeStream(["x"]))
+    assert "".join(second) == "abc"
+
+
+def test_concurrent_calls_are_capped():
+    manager = AiRequestManager(max_concurrent=2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def start():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return ["done"]
+
+    subscriptions = [manager.stream(f"key{i}", start) for i in range(6)]
+    assert ["".join(subscription) for subscription in subscriptions] == ["done"] * 6
+    assert max(peak) == 2
+
+
+def test_slots_are_given_in_request_order():
+    manager = AiRequestManager(max_concurrent=1)
+    order = []
+    blocker = FakeStream()
+    first = manager.stream("first", lambda: blocker)
+    wait_until(lambda: manager.active() == 1)
+
+    def start(name):
+        order.append(name)
+        return [name]
+
+    later = []
+    for name in "abcde":
+        later.append(manager.stream(name, lambda name=name: start(name)))
+        # Let each call thread join the line before the next one starts
+        wait_until(lambda count=len(later): len(manager._waiting) == count)
+    first.cancel()
+    assert ["".join(subscription) for subscription in later] == list("abcde")
+    assert order == list("abcde")
+
+
+def test_cancel_wakes_the_reader_and_closes_the_stream():
+    manager = AiRequestManager()
+    stream = FakeStream(delay=10)
+    subscription = manager.stream("key", lambda: stream)
+    errors = []
+
+    def read():
+        try:
+            for _ in subscription:
+                pass
+        except RequestCancelled:
+            errors.append("cancelled")
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    wait_until(lambda: manager.active() == 1)
+    subscription.cancel()
+    reader.join(0.5)
+    assert errors == ["cancelled"]
+    assert stream.closed.is_set()
+    wait_until(lambda: manager.active() == 0)
+
+
+def test_slot_is_held_until_the_call_thread_ends():
+    manager = AiRequestManager(max_concurrent=1)
+    release = threading.Event()
+
+    class StubbornStream(FakeStream):
+        def close(self):
+            # Closing only takes effect once the network gives up
+            release.wait()
+            super().close()
+
+    # The call thread is blocked reading until the stream is really closed
+    stream = StubbornStream(delay=10)
+    subscription = manager.stream("key", lambda: stream)
+    wait_until(lambda: manager.active() == 1)
+    threading.Thread(target=subscription.cancel, daemon=True).start()
+    second = manager.stream("other", lambda: ["next"])
+    time.sleep(0.05)
+    assert manager.active() == 1
+    release.set()
+    assert "".join(second) == "next"
+
+
+def test_a_call_cancelled_while_waiting_never_starts():
+    manager = AiRequestManager(max_concurrent=1)
+    first = manager.stream("first", lambda: FakeStream())
+    wait_until(lambda: manager.active() == 1)
+    started = []
+    waiting = manager.stream("waiting", lambda: started.append(1) or ["x"])
+    wait_until(lambda: len(manager._waiting) == 1)
+    waiting.cancel()
+    wait_until(lambda: not manager._waiting)
+    first.cancel()
+    wait_until(lambda: manager.active() == 0)
+    assert started == []
+
+
+def test_quota_errors_are_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(ai_requests, "BACKOFF_BASE", 0.05)
+    manager = AiRequestManager()
+    attempts = []
+
+    def start():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise google_exceptions.ResourceExhausted("429")
+        return ["ok"]
+
+    assert "".join(manager.stream("key", start)) == "ok"
+    assert len(attempts) == 3
+    assert attempts[1] - attempts[0] >= 0.05 * 0.75
+    assert attempts[2] - attempts[1] >= 0.1 * 0.75
+
+
+def test_quota_retries_give_up(monkeypatch):
+    monkeypatch.setattr(ai_requests, "BACKOFF_BASE", 0.01)
+    manager = AiRequestManager(max_attempts=3)
+    attempts = []
+
+    def start():
+        attempts.append(1)
+        raise google_exceptions.ResourceExhausted("429")
+
+    with pytest.raises(google_exceptions.ResourceExhausted):
+        "".join(manager.stream("key", start))
+    assert len(attempts) == 3
+
+
+def test_other_errors_are_not_retried():
+    manager = AiRequestManager()
+    attempts = []
+
+    def start():
+        attempts.append(1)
+        raise google_exceptions.PermissionDenied("bad key")
+
+    with pytest.raises(google_exceptions.PermissionDenied):
+        "".join(manager.stream("key", start))
+    assert attempts == [1]
@@ -0,0 +1,17 @@
+import ntpath
+from types import SimpleNamespace
+
+import app_paths
+from app_paths import is_inside
+
+
+def test_is_inside():
+    assert is_inside("/a/b/c.py", "/a/b")
+    assert is_inside("/a/b", "/a/b/")
+    assert not is_inside("/a/bc/d.py", "/a/b")
+
+
+def test_is_inside_on_other_windows_drives(monkeypatch):
+    monkeypatch.setattr(app_paths, "os", SimpleNamespace(path=ntpath))
+    assert not is_inside("D:\\src\\a.py", "C:\\src")
+    assert is_inside("c:\\SRC\\a.py", "C:\\src")
@@ -0,0 +1,60 @@
+import os
+
+import fitz
+
+from catalog import LibraryCatalog
+
+
+def make_pdf(path, pages=1, title=None):
+    document = fitz.open()
+    for _ in range(pages):
+        document.new_page()
+    if title:
+        document.set_metadata({"title": title})
+    document.save(str(path))
+
+
+def test_scan_reads_only_new_and_changed_files(tmp_path):
+    folder = tmp_path / "lib"
+    folder.mkdir()
+    make_pdf(folder / "a.pdf", pages=2, title="Notes")
+    make_pdf(folder / "b.pdf")
+    catalog = LibraryCatalog(str(tmp_path / "catalog.sqlite3"))
+
+    updated = []
+    catalog.scan(str(folder), updated.append)
+    assert len(updated) == 2
+    entry = catalog.entry(str(folder / "a.pdf"))
+    assert (entry.page_count, entry.title) == (2, "Notes")
+
+    updated.clear()
+    catalog.scan(str(folder), updated.append)
+    assert updated == []
+
+    make_pdf(folder / "b.pdf", pages=3)
+    os.utime(folder / "b.pdf", (1, 1))
+    catalog.scan(str(folder), updated.append)
+    assert [entry.page_count for entry in updated] == [3]
+
+
+def test_scan_reports_removed_files(tmp_path):
+    folder = tmp_path / "lib"
+    folder.mkdir()
+    make_pdf(folder / "a.pdf")
+    catalog = LibraryCatalog(str(tmp_path / "catalog.sqlite3"))
+    catalog.scan(str(folder))
+    os.remove(folder / "a.pdf")
+    removed = []
+    catalog.scan(str(folder), on_removed=removed.append)
+    assert removed == [os.path.normcase(str(folder / "a.pdf"))]
+    assert catalog.entry(str(folder / "a.pdf")) is None
+
+
+def test_thumbnails_are_keyed_by_the_paths_asked_for(tmp_path):
+    folder = tmp_path / "lib"
+    folder.mkdir()
+    make_pdf(folder / "a.pdf")
+    catalog = LibraryCatalog(str(tmp_path / "catalog.sqlite3"))
+    catalog.scan(str(folder))
+    asked = str(folder) + "//a.pdf"
+    assert list(catalog.thumbnails([asked])) == [asked]
@@ -0,0 +1,86 @@
+from chat_session import SUMMARY_REPLY, ChatSession, history_parts
+from response_cache import response_key
+from retrieval import estimate_tokens
+
+
+def history_tokens(session):
+    return sum(estimate_tokens(content["parts"][0]) for content in session.history())
+
+
+def test_follow_up_leaves_out_unchanged_code():
+    session = ChatSession()
+    first = session.message("explain", "x = 1")
+    assert "x = 1" in first
+    session.record("explain", "x = 1", first, "answer")
+    assert session.message("why?", "x = 1") == "why?"
+    assert "y = 2" in session.message("and now?", "y = 2")
+
+
+def test_history_stays_within_budget():
+    session = ChatSession(history_budget=400, summary_budget=100)
+    code = "x = 1\n" * 50
+    sizes = []
+    for turn in range(40):
+        sent = session.message(f"question {turn}", code)
+        session.record(f"question {turn}", code, sent, "answer " * 100)
+        sizes.append(history_tokens(session))
+    # The newest turn stays whole; the rest is capped by the two budgets
+    newest = estimate_tokens(session.history()[-2]["parts"][0]) + estimate_tokens("answer " * 100)
+    assert max(sizes[10:]) <= 400 + 100 + newest
+    assert max(sizes[10:]) - min(sizes[10:]) < 100
+
+
+def test_dropped_turns_are_summarized():
+    session = ChatSession(history_budget=100)
+    for turn in range(5):
+        session.record(f"question {turn}", "", f"question {turn}", "answer " * 60)
+    summary = session.history()[0]["parts"][0]
+    assert "question 0" in summary
+    assert len(session.history()) < 2 * 5
+
+
+def test_code_is_sent_again_once_its_turn_is_dropped():
+    session = ChatSession(history_budget=100)
+    sent = session.message("explain", "x = 1")
+    session.record("explain", "x = 1", sent, "answer " * 60)
+    session.record("more", "x = 1", session.message("more", "x = 1"), "answer " * 60)
+    assert "x = 1" in session.message("again", "x = 1")
+
+
+def test_reset_forgets_everything():
+    session = ChatSession()
+    session.record("q", "c", "qc", "a")
+    session.reset()
+    assert session.history() == []
+    assert len(session) == 0
+
+
+def test_history_alternates_user_and_model():
+    session = ChatSession(history_budget=100)
+    for turn in range(4):
+        session.record(f"question {turn}", "", f"question {turn}", "answer " * 60)
+    history = session.history()
+    assert [content["role"] for content in history] == ["user", "model"] * (len(history) // 2)
+    assert history[1]["parts"] == [SUMMARY_REPLY]
+
+
+def test_passages_come_before_the_command():
+    assert ChatSession().message("why?", "x = 1", "Passages\n").startswith("Passages\nwhy?")
+
+
+def test_history_parts_tell_conversations_apart():
+    explained, fixed = ChatSession(), ChatSession()
+    explained.record("explain", "x = 1", "explain\nx = 1", "It sets x.")
+    fixed.record("fixit", "x = 1", "fixit\nx = 1", "Nothing to fix.")
+    assert history_parts(ChatSession().history()) == []
+    assert response_key("shorter", *history_parts(explained.history())) != \
+        response_key("shorter", *history_parts(fixed.history()))
+
+
+def test_a_turn_over_budget_is_cut_down():
+    session = ChatSession(history_budget=400)
+    code = "x = 1\n" * 3000
+    session.record("explain", code, session.message("explain", code), "answer " * 3000)
+    assert history_tokens(session) <= 400 + 2
+    # The cut turn no longer holds the code, so the next turn sends it again
+    assert code in session.message("why?", code)
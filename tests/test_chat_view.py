@@ -0,0 +1,35 @@
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication, QTextEdit
+
+from chat_view import MarkdownStream, closed_length
+
+app = QApplication.instance() or QApplication([])
+
+
+def test_closed_length_waits_for_the_next_block():
+    assert closed_length("para\n\n") == 0
+    assert closed_length("para\n\nnext\n") == len("para\n\n")
+
+
+def test_closed_length_keeps_fences_lists_and_quotes_open():
+    fenced = "```\nx\n\ny\n```\n\ntext\n"
+    assert closed_length(fenced) == len("```\nx\n\ny\n```\n\n")
+    assert closed_length("1. a\n\n2. b\n\n") == 0
+    assert closed_length("> a\n\n> b\n\n") == 0
+    assert closed_length("1. a\n\n2. b\n\nafter\n") == len("1. a\n\n2. b\n\n")
+
+
+def test_streamed_answer_ends_as_set_markdown():
+    answer = "# Title\n\nSome *text*.\n\n1. one\n\n2. two\n\n> quote\n\n```\ncode\n```\n\nend\n"
+    streamed, expected = QTextEdit(), QTextEdit()
+    stream = MarkdownStream(streamed)
+    stream.begin()
+    for start in range(0, len(answer), 7):
+        stream.append(answer[start:start + 7])
+        stream.flush()
+    stream.finish()
+    expected.setMarkdown(answer)
+    assert streamed.toMarkdown() == expected.toMarkdown()
@@ -0,0 +1,54 @@
+from context_builder import build_context, split_units
+
+
+def test_split_units_gives_back_the_source():
+    source = "import os\n\n\ndef f():\n    return 1\n\n\nclass A:\n    def g(self):\n        pass\n"
+    parts = split_units(source, "module.py", unit_budget=5)
+    assert "".join(parts) == source
+    assert parts[1].startswith("def f")
+    assert parts[2].startswith("class A")
+
+
+def test_split_units_groups_small_units():
+    source = "def f():\n    pass\n\n\ndef g():\n    pass\n"
+    assert split_units(source, "module.py") == [source]
+
+
+def test_split_units_splits_large_classes_at_methods():
+    methods = "".join(f"    def m{i}(self):\n        return {i}\n\n" for i in range(20))
+    source = "class A:\n" + methods
+    parts = split_units(source, "module.py", unit_budget=20)
+    assert "".join(parts) == source
+    assert len(parts) > 1
+
+
+def test_split_units_c_functions():
+    source = "#include <a.h>\nint f() {\n  return 1;\n}\nint g() {\n  return f();\n}\n"
+    parts = split_units(source, "file.c", unit_budget=3)
+    assert "".join(parts) == source
+    assert parts[1].startswith("int f")
+    assert parts[2].startswith("int g")
+
+
+def test_build_context_one_line_signatures():
+    source = "def f(x: int) -> str: return str(x)\ndef main():\n    return f(1)\n"
+    context = build_context(source, "module.py", cursor_line=2)
+    assert context.text.startswith("def f(x: int) -> str:\n    ...\n")
+
+
+def test_build_context_closes_c_classes():
+    source = "namespace n {\nclass A {\n  int f() {\n    return 1;\n  }\n};\n}\n"
+    context = build_context(source, "file.cpp", cursor_line=3)
+    assert context.text.endswith("  }\n};\n}\n")
+
+
+def test_build_context_counts_lines_like_ast():
+    source = "def a():\n    return 1\n\x0c\ndef b():\n    return a()\n"
+    context = build_context(source, "module.py", cursor_line=4)
+    assert context.text.endswith("def b():\n    return a()\n")
+
+
+def test_build_context_says_how_much_of_a_long_file_is_sent():
+    source = "x = 1\n" * 1000
+    context = build_context(source, "notes.txt", token_budget=100)
+    assert context.description == "whole file, cut to its first 67 of 1000 lines"
@@ -0,0 +1,68 @@
+from PyQt5.QtGui import QImage
+
+from library import DocumentPool, PageCache
+
+
+def image(width, height=10):
+    return QImage(width, height, QImage.Format_RGB888)
+
+
+def test_size_is_counted_in_bytes():
+    cache = PageCache(max_bytes=10_000)
+    first, second = image(20), image(30)
+    cache.put("a", first)
+    cache.put("b", second)
+    assert cache.stats()["bytes"] == first.sizeInBytes() + second.sizeInBytes()
+    # Replacing an entry counts only the new image
+    cache.put("a", image(10))
+    assert cache.stats()["bytes"] == image(10).sizeInBytes() + second.sizeInBytes()
+
+
+def test_least_recently_used_images_are_evicted():
+    size = image(20).sizeInBytes()
+    cache = PageCache(max_bytes=2 * size)
+    cache.put("a", image(20))
+    cache.put("b", image(20))
+    assert cache.get("a") is not None
+    cache.put("c", image(20))
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    stats = cache.stats()
+    assert stats["bytes"] == 2 * size
+    assert (stats["hits"], stats["evictions"]) == (1, 1)
+
+
+def test_images_larger_than_the_cache_are_not_kept():
+    cache = PageCache(max_bytes=100)
+    cache.put("big", image(100))
+    assert "big" not in cache
+    assert cache.stats()["bytes"] == 0
+
+
+def test_resize_evicts_down_to_the_new_size():
+    size = image(20).sizeInBytes()
+    cache = PageCache(max_bytes=4 * size)
+    for key in "abcd":
+        cache.put(key, image(20))
+    cache.resize(size)
+    assert cache.stats()["entries"] == 1
+    assert "d" in cache
+
+
+def test_keys_round_the_scale():
+    assert PageCache.key("a.pdf", 1.0, 0, 1.2000000000000002) == PageCache.key("a.pdf", 1.0, 0, 1.2)
+
+
+def test_document_pool_reopens_changed_files(tmp_path):
+    import fitz
+    path = str(tmp_path / "a.pdf")
+    document = fitz.open()
+    document.new_page()
+    document.save(path)
+    pool = DocumentPool(size=1)
+    first = pool.get(path, 1.0)
+    assert pool.get(path, 1.0) is first
+    # A new mtime stands for a changed file; the stale handle is closed
+    assert pool.get(path, 2.0) is not first
+    assert first.is_closed
+    pool.close()
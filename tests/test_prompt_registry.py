@@ -0,0 +1,24 @@
+import os
+
+from prompt_registry import PromptCommand, PromptRegistry
+
+
+def test_templates_are_reloaded_when_their_file_changes(tmp_path):
+    path = tmp_path / "explain.txt"
+    path.write_text("Explain.", encoding="utf-8")
+    registry = PromptRegistry(str(tmp_path), [PromptCommand("None", None), PromptCommand("explain", "explain.txt")])
+    assert registry.template("explain") == "Explain."
+    assert registry.template("None") == ""
+
+    path.write_text("Explain briefly.", encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert registry.template("explain") == "Explain briefly."
+
+
+def test_a_deleted_template_keeps_its_last_text(tmp_path):
+    path = tmp_path / "explain.txt"
+    path.write_text("Explain.", encoding="utf-8")
+    registry = PromptRegistry(str(tmp_path), [PromptCommand("explain", "explain.txt")])
+    os.remove(path)
+    assert registry.template("explain") == "Explain."
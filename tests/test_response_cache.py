@@ -0,0 +1,46 @@
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, response_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_response_key_depends_on_part_boundaries():
+    assert response_key("ab", "c") != response_key("a", "bc")
+    assert response_key("a", "b") == response_key("a", "b")
+    assert response_key("a", None) == response_key("a", "")
+
+
+def test_answers_outlive_the_process(tmp_path):
+    ResponseCache(str(tmp_path / "responses.sqlite3")).put("key", "answer")
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    assert cache.get("key") == "answer"
+    assert cache.get("other") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_least_recently_used_answers_are_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), memory_entries=1, disk_entries=2)
+    for key in "ab":
+        cache.put(key, key.upper())
+        clock[0] += 1
+    assert cache.get("a") == "A"
+    clock[0] += 1
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+
+
+def test_expired_answers_are_dropped(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), ttl=60)
+    cache.put("key", "answer")
+    clock[0] += 61
+    assert cache.get("key") is None
+    assert ResponseCache(str(tmp_path / "responses.sqlite3"), ttl=3600).get("key") is None
@@ -0,0 +1,34 @@
+from retrieval import Retriever
+from search_index import SearchIndex
+
+
+def make_retriever(tmp_path, documents):
+    index = SearchIndex(str(tmp_path / "search.sqlite3"))
+    for path, pages in documents.items():
+        index._add(path, 1, 1.0, pages)
+    index._db.get().commit()
+    return Retriever(index, str(tmp_path / "retrieval.sqlite3"))
+
+
+def test_retrieve_only_reads(tmp_path):
+    retriever = make_retriever(tmp_path, {"/lib/a.pdf": ["gradient descent converges"]})
+    assert retriever.retrieve("gradient") == []
+    retriever.update()
+    assert [passage.path for passage in retriever.retrieve("gradient")] == ["/lib/a.pdf"]
+
+
+def test_common_terms_still_rank(tmp_path):
+    # In a single-topic library the key term is in nearly every passage
+    documents = {f"/lib/{i}.pdf": [f"entropy of system {i}"] for i in range(5)}
+    documents["/lib/best.pdf"] = ["entropy entropy entropy increases"]
+    retriever = make_retriever(tmp_path, documents)
+    retriever.update()
+    passages = retriever.retrieve("entropy")
+    assert passages
+    assert passages[0].path == "/lib/best.pdf"
+
+
+def test_update_stops_when_asked(tmp_path):
+    retriever = make_retriever(tmp_path, {"/lib/a.pdf": ["alpha"], "/lib/b.pdf": ["alpha"]})
+    retriever.update(should_stop=lambda: True)
+    assert retriever.retrieve("alpha") == []
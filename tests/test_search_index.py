@@ -0,0 +1,37 @@
+from search_index import SearchIndex
+
+
+def make_index(tmp_path, documents):
+    index = SearchIndex(str(tmp_path / "search.sqlite3"))
+    for path, pages in documents.items():
+        index._add(path, 1, 1.0, pages)
+    index._db.get().commit()
+    return index
+
+
+def test_the_last_term_matches_as_a_prefix(tmp_path):
+    index = make_index(tmp_path, {"/lib/a.pdf": ["thermodynamics lecture"], "/lib/b.pdf": ["thermal lecture"]})
+    assert {hit.path for hit in index.search("lecture therm")} == {"/lib/a.pdf", "/lib/b.pdf"}
+    assert {hit.path for hit in index.search("thermo lecture")} == set()
+    assert {hit.path for hit in index.search("lecture thermo")} == {"/lib/a.pdf"}
+
+
+def test_every_term_must_be_on_the_page(tmp_path):
+    index = make_index(tmp_path, {"/lib/a.pdf": ["alpha beta", "alpha"]})
+    hits = index.search("alpha beta")
+    assert [(hit.path, hit.page) for hit in hits] == [("/lib/a.pdf", 0)]
+
+
+def test_search_stays_inside_the_folder(tmp_path):
+    index = make_index(tmp_path, {"/lib/a.pdf": ["entropy"], "/lib/sub/b.pdf": ["entropy"],
+                                  "/library/c.pdf": ["entropy"]})
+    assert {hit.path for hit in index.search("entropy", "/lib/sub")} == {"/lib/sub/b.pdf"}
+    # A folder is not a prefix of a sibling with a longer name
+    assert {hit.path for hit in index.search("entropy", "/lib")} == {"/lib/a.pdf", "/lib/sub/b.pdf"}
+
+
+def test_forget_drops_a_document(tmp_path):
+    index = make_index(tmp_path, {"/lib/a.pdf": ["entropy"], "/lib/b.pdf": ["entropy"]})
+    index.forget("/lib/a.pdf")
+    assert set(index.documents()) == {"/lib/b.pdf"}
+    assert [hit.path for hit in index.search("entropy")] == ["/lib/b.pdf"]